@@ -1,43 +1,74 @@
+import argparse
 import csv
-import logging
 import os
-import shlex
-import subprocess
-import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import List, Tuple
 
+from common import load_library
 from mediaserver import MediaServer
+from store import CropStore, default_path
+
+
+def crop_files(res: dict) -> List[Path]:
+    return [f for f in Path(res['Filename (path)']).glob('crop_*_*.csv')
+            if all(t.isdigit() for t in f.stem.split('_')[1:])]
+
+
+def backfill_csv(imdb_id: str, output_file: Path) -> bool:
+    """
+    Fills in the imdbid column where missing, the file is only rewritten (via a temp file and rename so an
+    interrupted run never leaves a partial file) if some row actually changed.
+    :return: true if the file was updated.
+    """
+    with output_file.open(mode='r', newline='') as f:
+        rows = list(csv.reader(f))
+    if not rows:
+        return False
+    idx = rows[0].index('imdbid')
+    missing = [r for r in rows[1:] if not r[idx]]
+    if not missing:
+        return False
+    for r in missing:
+        r[idx] = imdb_id
+    tmp = output_file.with_suffix('.tmp')
+    with tmp.open(mode='w', newline='') as f:
+        csv.writer(f).writerows(rows)
+    os.replace(tmp, output_file)
+    return True
+
 
 if __name__ == '__main__':
-    mc = MediaServer(sys.argv[1], (sys.argv[2], sys.argv[3]))
-    lib_p = sys.argv[4]
-    real_p = sys.argv[5]
-    skip = 24
-    limit = 18
-    fields = 'File Type,Filename (path),Filename (name),Video Crop,Aspect Ratio,Dimensions,CropAR,Name,IMDb ID,Duration'
-    results = mc.search('[Dimensions]=[1920 x 1080],[3840 x 2160] -[Video Crop]=[],[0x0x0x0]', fields)
-    for res in results:
-        if 'Aspect Ratio' not in res:
-            continue
-
-        if 'IMDb ID' not in res:
-            continue
-
-        res['Filename (path)'] = res['Filename (path)'].replace(lib_p, real_p).replace('\\', '/')
-
-        output_file = Path(res['Filename (path)']) / f'crop_{limit}_{skip}.csv'
-        if not output_file.exists():
-            continue
-
-        rows = []
-        with output_file.open(mode='r') as f:
-            for i, r in enumerate(csv.reader(f)):
-                if i == 0:
-                    continue
-                if not r[2]:
-                    r[2] = res['IMDb ID']
-                rows.append(r)
-        with output_file.open(mode='w') as f:
-            csvf = csv.writer(f)
-            csvf.writerow('key,name,imdbid,ts,w,h,x,y,crop,ar,mc_crop,mc_ar,match'.split(','))
-            csvf.writerows(rows)
+    parser = argparse.ArgumentParser(prog='add_imdb', description='Fills in missing IMDb IDs in the crop results')
+    parser.add_argument('ip', help='MCWS host:port')
+    parser.add_argument('user')
+    parser.add_argument('password')
+    parser.add_argument('lib_p', help='Library path prefix as seen by MC')
+    parser.add_argument('real_p', help='Library path prefix as seen locally')
+    parser.add_argument('--csv', help='Also backfill every crop_{limit}_{skip}.csv file alongside each title',
+                        action='store_true')
+    parser.add_argument('-w', '--workers', help='No of csv files to process at once', default=16, type=int)
+    parser.add_argument('--refresh', help='Refetch the library from MC rather than using the cached snapshot',
+                        action='store_true')
+    args = parser.parse_args()
+
+    mc = MediaServer(args.ip, (args.user, args.password))
+    lib_p = args.lib_p
+    real_p = args.real_p
+    results = [res for res in load_library(mc, real_p, force=args.refresh).items if 'Aspect Ratio' in res and 'IMDb ID' in res]
+    updated = 0
+    with CropStore(default_path(real_p)) as store:
+        for res in results:
+            updated += store.set_imdb(res['Key'], res['IMDb ID'])
+    print(f'Updated {updated} samples')
+
+    if args.csv:
+        for res in results:
+            res['Filename (path)'] = res['Filename (path)'].replace(lib_p, real_p).replace('\\', '/')
+
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            files: List[Tuple[str, Path]] = [(res['IMDb ID'], f)
+                                             for res, title_files in zip(results, executor.map(crop_files, results))
+                                             for f in title_files]
+            changed = sum(executor.map(lambda f: backfill_csv(*f), files))
+        print(f'Updated {changed} of {len(files)} csv files')
@@ -1,16 +1,24 @@
-import csv
-import sys
-from collections import defaultdict
+import argparse
 from pathlib import Path
 
+from analysis import modal_crops, wide
+from common import load_library
 from mediaserver import MediaServer
+from store import CropStore, default_path
 
 if __name__ == '__main__':
-    mc = MediaServer(sys.argv[1], (sys.argv[2], sys.argv[3]))
-    lib_p = sys.argv[4]
-    real_p = sys.argv[5]
-    fields = 'Filename (path),Filename (name),Name,Dimensions,Year'
-    results = mc.search('[Dimensions]=[1920 x 1080],[3840 x 2160] -[Video Crop]=[],[0x0x0x0]', fields)
+    parser = argparse.ArgumentParser(prog='analyse_crop', description='Compares the detected crops with the MC crop')
+    parser.add_argument('ip', help='MCWS host:port')
+    parser.add_argument('user')
+    parser.add_argument('password')
+    parser.add_argument('real_p', help='Library path prefix as seen locally')
+    parser.add_argument('--refresh', help='Refetch the library from MC rather than using the cached snapshot',
+                        action='store_true')
+    args = parser.parse_args()
+
+    mc = MediaServer(args.ip, (args.user, args.password))
+    real_p = args.real_p
+    library = load_library(mc, real_p, force=args.refresh)
 
     def c_name(l, s) -> str:
         return f'{l}_{s}_fcrop'
@@ -23,47 +31,19 @@ if __name__ == '__main__':
         for limit in limits:
             out_cols.append(c_name(limit, skip))
     out_cols.append('exact')
-    out_data = []
 
-    for res in results:
-        res['Filename (path)'] = res['Filename (path)'].replace(lib_p, real_p).replace('\\', '/')
-
-        crops = [p for p in Path(res['Filename (path)']).glob('crop*.csv')]
-        if not crops:
-            continue
-
-        d = [''] * len(out_cols)
-        d[0] = res['Name']
-        d[1] = res['Dimensions']
-        d[2] = str(res.get('Year', 0))
-        for crop in crops:
-            t = crop.name[:-4].split('_')
-            f_crop_name = c_name(t[1],t[2])
-            try:
-                out_idx = out_cols.index(f_crop_name)
-                with crop.open(mode='r') as f:
-                    unique_crop_counts = defaultdict(int)
-                    mc_crop = None
-                    for i, r in enumerate(csv.reader(f)):
-                        if i == 0:
-                            cols = {c: i for i, c in enumerate(r)}
-                        else:
-                            unique_crop_counts[r[cols['crop']]] = unique_crop_counts[r[cols['crop']]] + 1
-                            if not d[3]:
-                                d[3] = r[cols['mc_crop']]
-                    popular_crops = sorted(unique_crop_counts.items(), key=lambda x: x[1], reverse=True)
-                    if popular_crops:
-                        d[out_idx] = popular_crops[0][0]
-                    else:
-                        print(f"No Crops in {crop}")
-            except ValueError:
-                print(f'{f_crop_name} is not known, ignoring')
-                continue
-        d[-1] = str(len(set(d[3:-1])) == 1)
-        out_data.append(d)
-        print('\t'.join(d))
-
-    with (Path(real_p) / 'crop_analysis.csv').open(mode='w') as f:
-        csvf = csv.writer(f)
-        csvf.writerow(out_cols)
-        csvf.writerows(out_data)
+    with CropStore(default_path(real_p)) as store:
+        samples = store.samples()
+
+    unknown = set(zip(samples['limit'], samples['skip'])) - {(l, s) for l in limits for s in skips}
+    for limit, skip in unknown:
+        print(f'{c_name(limit, skip)} is not known, ignoring')
+    samples = samples[samples['limit'].isin(limits) & samples['skip'].isin(skips)]
+
+    df = wide(modal_crops(samples))
+    titles = df['key'].map(lambda k: library.by_key(k) or {})
+    df['res'] = titles.map(lambda t: t.get('Dimensions', '')).where(titles.map(bool), df['res'])
+    df['year'] = titles.map(lambda t: str(t.get('Year', 0)))
+    df = df.reindex(columns=out_cols).fillna('')
+    print(df.to_csv(sep='\t', index=False, header=False), end='')
+    df.to_csv(Path(real_p) / 'crop_analysis.csv', index=False)
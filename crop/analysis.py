@@ -0,0 +1,87 @@
+import pandas as pd
+
+W_TOLERANCE_PX = 16
+H_TOLERANCE_PX = 16
+
+GROUP = ['key', 'limit', 'skip']
+
+
+def crop_edges(crops: pd.Series, prefix: str) -> pd.DataFrame:
+    """
+    :param crops: crops formatted as x1xy1xx2xy2.
+    :param prefix: column name prefix.
+    :return: width, height and aspect ratio of each crop.
+    """
+    edges = crops.str.split('x', expand=True).astype(int)
+    w = edges[2] - edges[0]
+    h = edges[3] - edges[1]
+    return pd.DataFrame({
+        f'{prefix}w': w,
+        f'{prefix}h': h,
+        f'{prefix}ar': (w / h.where(h != 0)).round(2),
+        # frame size assuming the crop is centred
+        'w': edges[2] + edges[0],
+        'h': edges[3] + edges[1]
+    }, index=crops.index)
+
+
+def modal_crops(samples: pd.DataFrame) -> pd.DataFrame:
+    """
+    :param samples: every crop sample, as read from the CropStore.
+    :return: the most frequently detected crop per title and parameter set, ties go to the first crop seen.
+    """
+    counts = samples.groupby(GROUP + ['crop'], sort=False).size().rename('samples').reset_index()
+    modal = counts.sort_values('samples', ascending=False, kind='stable').drop_duplicates(GROUP)
+    titles = samples.drop_duplicates('key')[['key', 'name', 'dimensions', 'mc_crop', 'mc_ar']]
+    return modal.rename(columns={'crop': 'ffmpeg_crop'}).merge(titles, on='key', how='left').sort_values(GROUP)
+
+
+def compare(modal: pd.DataFrame, w_tolerance_px: int = W_TOLERANCE_PX,
+            h_tolerance_px: int = H_TOLERANCE_PX) -> pd.DataFrame:
+    """
+    :param modal: output of modal_crops.
+    :return: modal with the size of each crop and whether the detected crop is within tolerance of the MC crop.
+    """
+    f_edges = crop_edges(modal['ffmpeg_crop'], 'ffmpeg_').drop(columns=['w', 'h'])
+    m_edges = crop_edges(modal['mc_crop'], 'mc_').rename(columns={'mc_ar': 'mc_ar_calc'})
+    df = pd.concat([modal, f_edges, m_edges], axis=1)
+    df['w_delta'] = (df['ffmpeg_w'] - df['mc_w']).abs()
+    df['h_delta'] = (df['ffmpeg_h'] - df['mc_h']).abs()
+    df['w_ok'] = df['w_delta'] <= w_tolerance_px
+    df['h_ok'] = df['h_delta'] <= h_tolerance_px
+    df['ok'] = df['w_ok'] & df['h_ok']
+    df['exact'] = df['ffmpeg_crop'] == df['mc_crop']
+    return df
+
+
+def summarise(compared: pd.DataFrame) -> pd.DataFrame:
+    """
+    :param compared: output of compare.
+    :return: one row per title indicating whether every parameter set is within tolerance / exact and whether the
+    detected crop changes with limit (for a fixed skip) or with skip (for a fixed limit).
+    """
+    by_title = compared.groupby('key', sort=False)
+    summary = by_title.agg(name=('name', 'first'),
+                           w=('w', 'first'),
+                           h=('h', 'first'),
+                           ok=('ok', 'all'),
+                           exact=('exact', 'all'))
+    summary['res'] = summary['w'].astype(str) + 'x' + summary['h'].astype(str)
+    summary['limit_sensitive'] = compared.groupby(['key', 'skip'])['ffmpeg_crop'].nunique().gt(1).groupby('key').any()
+    summary['skip_sensitive'] = compared.groupby(['key', 'limit'])['ffmpeg_crop'].nunique().gt(1).groupby('key').any()
+    return summary.reset_index()
+
+
+def wide(modal: pd.DataFrame) -> pd.DataFrame:
+    """
+    :param modal: output of modal_crops.
+    :return: one row per title with a {limit}_{skip}_fcrop column per parameter set and whether they all agree with
+    the MC crop.
+    """
+    pivot = modal.pivot(index='key', columns=['limit', 'skip'], values='ffmpeg_crop')
+    pivot.columns = [f'{limit}_{skip}_fcrop' for limit, skip in pivot.columns]
+    titles = modal.drop_duplicates('key').set_index('key')[['name', 'dimensions', 'mc_crop']]
+    df = titles.join(pivot)
+    crop_cols = ['mc_crop'] + list(pivot.columns)
+    df['exact'] = df[crop_cols].nunique(axis=1, dropna=False).eq(1)
+    return df.rename(columns={'dimensions': 'res'}).reset_index()
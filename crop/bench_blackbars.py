@@ -0,0 +1,33 @@
+import argparse
+import time
+
+import blackbars
+import cropdetect
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='bench_blackbars',
+                                     description='Compares ffmpeg cropdetect text parsing with the numpy detector')
+    parser.add_argument('path', help='Video to sample')
+    parser.add_argument('-o', '--offsets', help='Sample positions in seconds', nargs='+', type=int,
+                        default=[300, 720, 1320, 2280, 2520])
+    parser.add_argument('--scale', help='Downsample factor for the numpy detector', default=1, type=int)
+    args = parser.parse_args()
+
+    params = [(24, 18), (24, 25), (8, 18), (8, 25)]
+
+    def timed(func):
+        before = time.perf_counter()
+        res = [func(offset) for offset in args.offsets]
+        return time.perf_counter() - before, res
+
+    ffmpeg_t, ffmpeg_res = timed(lambda o: cropdetect.crop('bench', args.path, params, o))
+    numpy_t, numpy_res = timed(lambda o: blackbars.crop('bench', args.path, params, o, scale=args.scale))
+
+    print(f'ffmpeg cropdetect: {ffmpeg_t:.3f}s')
+    print(f'numpy (scale={args.scale}): {numpy_t:.3f}s')
+    for offset, f_res, n_res in zip(args.offsets, ffmpeg_res, numpy_res):
+        for p in params:
+            f_crops = {c['crop'] for c in f_res[p]}
+            n_crops = {c['crop'] for c in n_res[p]}
+            status = 'MATCH' if f_crops == n_crops else 'DIFF'
+            print(f'{offset:>5}s skip={p[0]} limit={p[1]} {status} ffmpeg={sorted(f_crops)} numpy={sorted(n_crops)}')
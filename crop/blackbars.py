@@ -0,0 +1,131 @@
+import shlex
+import subprocess
+from fractions import Fraction
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+# cropdetect defaults
+ROUND = 16
+
+
+def probe(path: str) -> Tuple[int, int, float]:
+    """
+    :param path: the video.
+    :return: width, height and frame rate of the first video stream.
+    """
+    cmd = f'ffprobe -v error -select_streams v:0 -show_entries stream=width,height,r_frame_rate -of csv=p=0 "{path}"'
+    out = subprocess.check_output(shlex.split(cmd)).decode().strip().splitlines()[0].split(',')
+    return int(out[0]), int(out[1]), float(Fraction(out[2]))
+
+
+def read_line_sums(path: str, offset: int, duration: float = 2, scale: int = 1,
+                   bit_depth: int = 8) -> Tuple[np.ndarray, np.ndarray, int, int, float]:
+    """
+    Decodes a segment once as luma only rawvideo and reduces each frame to the sum of each row and column.
+    :param path: the video.
+    :param offset: the sample position in seconds.
+    :param duration: the length of the sample in seconds.
+    :param scale: downsample factor applied by ffmpeg before the frames are read.
+    :param bit_depth: 8 or 16, higher bit depth sources are read as gray16le.
+    :return: row sums (frames x height), column sums (frames x width), frame width, frame height, frame rate.
+    """
+    src_w, src_h, fps = probe(path)
+    w = src_w // scale
+    h = src_h // scale
+    pix_fmt = 'gray' if bit_depth == 8 else 'gray16le'
+    dtype = np.uint8 if bit_depth == 8 else np.dtype('<u2')
+    vf = f'-vf scale={w}:{h}:flags=area ' if scale > 1 else ''
+    cmd = f'ffmpeg -v error -ss {offset} -t {duration} -i "{path}" {vf}-pix_fmt {pix_fmt} -f rawvideo -'
+    frame_bytes = w * h * np.dtype(dtype).itemsize
+    rows = []
+    cols = []
+    with subprocess.Popen(shlex.split(cmd), stdout=subprocess.PIPE, stderr=subprocess.DEVNULL) as proc:
+        buf = bytearray(frame_bytes)
+        while proc.stdout.readinto(buf) == frame_bytes:
+            frame = np.frombuffer(buf, dtype=dtype).reshape(h, w)
+            rows.append(frame.sum(axis=1, dtype=np.int64))
+            cols.append(frame.sum(axis=0, dtype=np.int64))
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, cmd)
+    if not rows:
+        return np.empty((0, h), dtype=np.int64), np.empty((0, w), dtype=np.int64), w, h, fps
+    return np.stack(rows), np.stack(cols), w, h, fps
+
+
+def _bounds(sums: np.ndarray, length: int, threshold: float) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    :param sums: line sums, frames x lines.
+    :param length: the no of pixels in each line.
+    :param threshold: a line is content if its (integer) mean is above this.
+    :return: the running first and last content line per frame as cropdetect accumulates them.
+    """
+    lines = sums.shape[1]
+    bright = (sums // length) > threshold
+    any_bright = bright.any(axis=1)
+    first = np.where(any_bright, bright.argmax(axis=1), lines - 1)
+    last = np.where(any_bright, lines - 1 - bright[:, ::-1].argmax(axis=1), 0)
+    return np.minimum.accumulate(np.minimum(first, lines - 1)), np.maximum.accumulate(last)
+
+
+def _round(lo: np.ndarray, hi: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    As vf_cropdetect, the start is rounded up to even before the size is taken from it and then the size is shrunk to
+    a multiple of ROUND with the start moved in by (half) the amount removed.
+    :return: size and start.
+    """
+    start = (lo + 1) & ~1
+    size = hi - start + 1
+    shrink_by = size % ROUND
+    return size - shrink_by, start + ((shrink_by // 2 + 1) & ~1)
+
+
+def detect(row_sums: np.ndarray, col_sums: np.ndarray, w: int, h: int, fps: float, offset: int, skip: int,
+           limit: int, scale: int = 1, bit_depth: int = 8) -> List[dict]:
+    """
+    Replicates ffmpeg's cropdetect (black mode) over precomputed line sums, every frame after the first skip frames
+    yields the crop box accumulated so far.
+    :param row_sums: row sums (frames x height).
+    :param col_sums: column sums (frames x width).
+    :param w: the frame width as read.
+    :param h: the frame height as read.
+    :param fps: the frame rate.
+    :param offset: the sample position in seconds.
+    :param skip: no of initial frames to ignore.
+    :param limit: the black threshold on an 8 bit scale.
+    :param scale: the downsample factor the frames were read at, boxes are reported at full resolution.
+    :param bit_depth: the bit depth the frames were read at.
+    :return: the crop info in the same format as the ffmpeg text parsing path.
+    """
+    if row_sums.shape[0] <= skip:
+        return []
+    threshold = limit / 255 * ((1 << bit_depth) - 1)
+    y1, y2 = _bounds(row_sums[skip:], w, threshold)
+    x1, x2 = _bounds(col_sums[skip:], h, threshold)
+    x1 = x1 * scale
+    x2 = (x2 + 1) * scale - 1
+    y1 = y1 * scale
+    y2 = (y2 + 1) * scale - 1
+    cw, cx = _round(x1, x2)
+    ch, cy = _round(y1, y2)
+    ts = (np.arange(skip, row_sums.shape[0]) / fps) + offset
+    return [{
+        'ts': round(float(t), 6),
+        'w': int(w_),
+        'h': int(h_),
+        'x': int(x_),
+        'y': int(y_),
+        'crop': f'{x_}x{y_}x{x_ + w_}x{y_ + h_}',
+        'ar': f'{w_ / h_:.2f}' if h_ else '0'
+    } for t, w_, h_, x_, y_ in zip(ts, cw, ch, cx, cy)]
+
+
+def crop(name: str, path: str, params: List[Tuple[int, int]], offset: int, scale: int = 1,
+         bit_depth: int = 8) -> Dict[Tuple[int, int], List[dict]]:
+    """
+    Drop in replacement for cropdetect.crop which decodes the segment once and evaluates every (skip, limit) in numpy.
+    """
+    row_sums, col_sums, w, h, fps = read_line_sums(path, offset, scale=scale, bit_depth=bit_depth)
+    return {(skip, limit): detect(row_sums, col_sums, w, h, fps, offset, skip, limit, scale=scale,
+                                  bit_depth=bit_depth)
+            for skip, limit in params}
@@ -0,0 +1,65 @@
+import sys
+from pathlib import Path
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Tuple, TypeVar
+
+from mediaserver import MediaServer
+from snapshot import LibrarySnapshot
+
+T = TypeVar('T')
+
+# every crop tool works over the same set of titles so share a single query (and hence snapshot) between them
+CROP_QUERY = '[Dimensions]=[1920 x 1080],[3840 x 2160] -[Video Crop]=[],[0x0x0x0]'
+CROP_FIELDS = 'File Type,Filename (path),Filename (name),Video Crop,Aspect Ratio,Dimensions,CropAR,Name,IMDb ID,Duration,Year'
+
+
+def load_library(mc: MediaServer, real_p: str, force: bool = False) -> LibrarySnapshot:
+    """
+    :param mc: the server.
+    :param real_p: the local path to the library root, the snapshot is cached beneath this directory.
+    :param force: if true, ignore any cached snapshot.
+    :return: the loaded snapshot.
+    """
+    snapshot = LibrarySnapshot(mc, CROP_QUERY, CROP_FIELDS, Path(real_p) / '.mcws')
+    snapshot.load(force=force)
+    return snapshot
+
+
+class JoinSummary:
+
+    def __init__(self):
+        self.matched = 0
+        self.unmatched: List[Hashable] = []
+        self.duplicates: Dict[Hashable, int] = {}
+
+    def report(self, file=sys.stdout):
+        print(f'Matched {self.matched}, unmatched {len(self.unmatched)}, duplicated {len(self.duplicates)}', file=file)
+        if self.unmatched:
+            print(f'Unmatched: {"; ".join(str(u) for u in self.unmatched)}', file=file)
+        if self.duplicates:
+            print(f'Duplicates: {"; ".join(f"{k} x{v}" for k, v in self.duplicates.items())}', file=file)
+
+
+def keyed_join(rows: Iterable[T], lookup: Callable[[Hashable], List[dict]],
+               row_key: Callable[[T], Hashable]) -> Tuple[List[Tuple[T, Optional[dict]]], JoinSummary]:
+    """
+    Left joins rows to items via an existing index, typically one held by LibrarySnapshot, where more than one item
+    shares a key the first one wins.
+    :param rows: the rows to join.
+    :param lookup: returns the items which match a key.
+    :param row_key: extracts the join key from a row.
+    :return: each row paired with its matching item (or None) and a summary of the join.
+    """
+    summary = JoinSummary()
+    joined = []
+    for row in rows:
+        key = row_key(row)
+        matches = lookup(key)
+        if matches:
+            summary.matched += 1
+            if len(matches) > 1:
+                summary.duplicates[key] = len(matches)
+            joined.append((row, matches[0]))
+        else:
+            summary.unmatched.append(key)
+            joined.append((row, None))
+    return joined, summary
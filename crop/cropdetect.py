@@ -1,13 +1,22 @@
+import argparse
 import csv
 import logging
 import os
-import shlex
-import subprocess
 import sys
-from datetime import datetime
+from collections import defaultdict
+from functools import partial
 from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
 
+import blackbars
+from common import load_library
+from manifest import ScanManifest
 from mediaserver import MediaServer
+from runner import stream_it
+from sampling import FIXED_OFFSETS, adaptive_crop
+from scheduler import Job, Scheduler, disk_of
+from store import CropStore, default_path
+from streams import StreamLocator
 
 logging.basicConfig()
 logger = logging.getLogger()
@@ -19,119 +28,234 @@ handler.setFormatter(formatter)
 logger.addHandler(handler)
 
 
-def run_it(name: str, cmd: str, **kwargs) -> subprocess.CompletedProcess[str]:
-    logger.debug(f'Executing {cmd}')
-    try:
-        return subprocess.check_output(shlex.split(cmd), **kwargs)
-    except subprocess.CalledProcessError as e:
-        logger.exception(f'{name} failed')
-        raise e
-    except Exception as e:
-        logger.exception(f'{name} Unexpected failure')
-        raise e
-
-
-def find_largest(res):
-    sz = 0
-    fn = None
-    with os.scandir(str((Path(res['Filename (path)']) / 'STREAM').absolute())) as it:
-        for f in it:
-            if f.is_file() and f.name.endswith('m2ts'):
-                f_sz = f.stat().st_size
-                if f_sz > sz:
-                    sz = f_sz
-                    fn = f
-    return sz, fn
-
-
-def crop(res, skip, limit):
-    crop_info = []
-    for i in [5, 12, 22, 38, 42]:
-        pad_i = f'0{i}' if i < 10 else i
-        lines = run_it('cropdetect',
-                       f'ffmpeg -ss 00:{pad_i}:00 -t 2 -i "{fn.path}" -vf cropdetect=skip={skip}:limit={limit/255} -f null -',
-                       stderr=subprocess.STDOUT).decode().split('\n')
-        crops = [l.split(' ') for l in lines if 'crop' in l]
-        if crops:
-            for c in crops:
-                ts = float(c[-3][2:]) + (i * 60)
-                crop = [int(i) for i in c[-1][5:].split(':')]
-                crop_info.append({
-                    'ts': ts,
-                    'w': crop[0],
-                    'h': crop[1],
-                    'x': crop[2],
-                    'y': crop[3],
-                    'crop': f'{crop[2]}x{crop[3]}x{crop[2] + crop[0]}x{crop[3] + crop[1]}',
-                    'ar': f'{crop[0] / crop[1]:.2f}' if crop[1] else '0'
-                })
-        else:
-            logger.warning(f'[{res["Name"]}] No crop info found in {fn.path} at 00:{pad_i}:00')
+def instance_name(skip: int, limit: int) -> str:
+    return f'cropdetect@s{skip}_l{limit}'
+
+
+def parse_crop(line: str, offset: int) -> dict:
+    tokens = line.split(' ')
+    ts = float(next(t for t in tokens if t.startswith('t:'))[2:]) + offset
+    crop = [int(i) for i in next(t for t in tokens if t.startswith('crop='))[5:].split(':')]
+    return {
+        'ts': ts,
+        'w': crop[0],
+        'h': crop[1],
+        'x': crop[2],
+        'y': crop[3],
+        'crop': f'{crop[2]}x{crop[3]}x{crop[2] + crop[0]}x{crop[3] + crop[1]}',
+        'ar': f'{crop[0] / crop[1]:.2f}' if crop[1] else '0'
+    }
+
+
+def crop(name: str, path: str, params: List[Tuple[int, int]], offset: int, timeout: Optional[float] = None,
+         stable_samples: Optional[int] = None) -> Dict[Tuple[int, int], List[dict]]:
+    """
+    Decodes a 2s segment once, cropdetect is a passthrough filter so each (skip, limit) is evaluated by chaining a
+    named cropdetect instance per parameter set. Output is parsed as ffmpeg writes it.
+    :param name: the title name.
+    :param path: the stream to sample.
+    :param params: the (skip, limit) pairs to evaluate.
+    :param offset: the sample position in seconds.
+    :param timeout: max seconds to allow ffmpeg to run for.
+    :param stable_samples: if set, stop decoding once every instance has reported the same crop this many times in a row.
+    :return: crop info by (skip, limit).
+    """
+    crop_info = {p: [] for p in params}
+    by_instance = {instance_name(skip, limit): (skip, limit) for skip, limit in params}
+    stable_for = {p: 0 for p in params}
+    filters = ','.join(f'{instance_name(skip, limit)}=skip={skip}:limit={limit/255}' for skip, limit in params)
+
+    def on_line(l: str) -> bool:
+        if 'crop=' in l and l.startswith('[cropdetect@'):
+            p = by_instance.get(l[1:l.index(' ')], None)
+            if p:
+                c = parse_crop(l, offset)
+                prev = crop_info[p][-1]['crop'] if crop_info[p] else None
+                stable_for[p] = stable_for[p] + 1 if prev == c['crop'] else 1
+                crop_info[p].append(c)
+                return stable_samples is not None and all(s >= stable_samples for s in stable_for.values())
+        return False
+
+    stats = stream_it('cropdetect', f'ffmpeg -ss {offset} -t 2 -i "{path}" -vf {filters} -f null -', on_line,
+                      timeout=timeout)
+    logger.info(f'[{name}] cropdetect at {offset}s took {stats.wall:.3f}s wall, '
+                f'{"?" if stats.cpu is None else f"{stats.cpu:.3f}"}s cpu{" (stable)" if stats.stopped_early else ""}')
+    for p, c in crop_info.items():
+        if not c:
+            logger.warning(f'[{name}] No crop info found in {path} at {offset}s for skip={p[0]} limit={p[1]}')
     return crop_info
 
 
+def log_match(crop_info, res) -> bool:
+    all_match = all(c['crop'] == res['Video Crop'] for c in crop_info)
+    if all_match:
+        logger.info(f'[{res["Name"]}] matches!')
+    else:
+        logger.error(f'[{res["Name"]}] MISMATCH!')
+    return all_match
+
+
 def dump_output(crop_info, res, output_file):
-    all_match = True
     with output_file.open(mode='w') as f:
         csvf = csv.writer(f)
         csvf.writerow('key,name,imdbid,ts,w,h,x,y,crop,ar,mc_crop,mc_ar,match'.split(','))
         for c in crop_info:
             matches = c['crop'] == res['Video Crop']
-            if not matches:
-                all_match = False
             csvf.writerow(
                 [res['Key'], res["Name"], res.get("IMDb ID", ''), c['ts'], c['w'],
                  c['h'], c['x'], c['y'], c['crop'], c['ar'], res['Video Crop'], res['Aspect Ratio'],
                  matches]
             )
-    if all_match:
-        logger.info(f'[{res["Name"]}] matches!')
-    else:
-        logger.error(f'[{res["Name"]}] MISMATCH!')
+    log_match(crop_info, res)
 
 
 if __name__ == '__main__':
-    mc = MediaServer(sys.argv[1], (sys.argv[2], sys.argv[3]))
-    lib_p = sys.argv[4]
-    real_p = sys.argv[5]
-    fields = 'File Type,Filename (path),Filename (name),Video Crop,Aspect Ratio,Dimensions,CropAR,Name,IMDb ID,Duration'
-    results = mc.search('[Dimensions]=[1920 x 1080],[3840 x 2160] -[Video Crop]=[],[0x0x0x0]', fields)
+    parser = argparse.ArgumentParser(prog='cropdetect',
+                                     description='Runs ffmpeg cropdetect against every bdmv title and compares with the MC Video Crop')
+    parser.add_argument('ip', help='MCWS host:port')
+    parser.add_argument('user')
+    parser.add_argument('password')
+    parser.add_argument('lib_p', help='Library path prefix as seen by MC')
+    parser.add_argument('real_p', help='Library path prefix as seen locally')
+    parser.add_argument('-w', '--workers', help='No of cropdetect jobs to run at once', default=os.cpu_count(), type=int)
+    parser.add_argument('-d', '--per-disk', help='Max no of cropdetect jobs to run against a single disk at once',
+                        default=2, type=int)
+    parser.add_argument('-p', '--processes', help='Use a process pool instead of a thread pool', action='store_true')
+    parser.add_argument('--detector', help='Detect crops via ffmpeg cropdetect or from raw frames in numpy',
+                        choices=['ffmpeg', 'numpy'], default='ffmpeg')
+    parser.add_argument('--scale', help='Downsample factor for the numpy detector', default=1, type=int)
+    parser.add_argument('-t', '--timeout', help='Max seconds to allow each ffmpeg cropdetect call to run for',
+                        type=float)
+    parser.add_argument('--stable-samples',
+                        help='Stop each ffmpeg cropdetect call once every setting has reported the same crop this many '
+                             'times in a row',
+                        type=int)
+    parser.add_argument('-s', '--single-decode', help='Evaluate every skip/limit against a single decode of each segment',
+                        action='store_true')
+    parser.add_argument('--main-playlist', help='Use the main clip of the longest playlist instead of the largest stream',
+                        action='store_true')
+    parser.add_argument('-a', '--adaptive',
+                        help='Choose sample positions from the title duration and stop sampling once the crops agree',
+                        action='store_true')
+    parser.add_argument('--csv', help='Also write crop_{limit}_{skip}.csv files alongside each title',
+                        action='store_true')
+    parser.add_argument('-m', '--manifest', help='Scan manifest file, defaults to crop_manifest.json in real_p')
+    parser.add_argument('-r', '--rescan', help='Rescan every title even if the manifest says it is up to date',
+                        action='store_true')
+    parser.add_argument('--refresh', help='Refetch the library from MC rather than using the cached snapshot',
+                        action='store_true')
+    args = parser.parse_args()
+
+    mc = MediaServer(args.ip, (args.user, args.password))
+    lib_p = args.lib_p
+    real_p = args.real_p
+    results = load_library(mc, real_p, force=args.refresh).items
     skips = [24, 8]
     limits = [18, 25]
-    min_mtime = float(datetime(2023, 6, 26, 16, 0, 0).strftime('%s'))
+    offsets = FIXED_OFFSETS
+    manifest = ScanManifest(Path(args.manifest) if args.manifest else Path(real_p) / 'crop_manifest.json')
+
+    locator = StreamLocator(Path(real_p) / 'crop_streams.json', use_playlist=args.main_playlist)
+    if args.detector == 'ffmpeg':
+        detector = partial(crop, timeout=args.timeout, stable_samples=args.stable_samples)
+    else:
+        detector = partial(blackbars.crop, scale=args.scale)
 
-    for res in results:
+    def params_id(skip: int, limit: int) -> str:
+        scale = f':scale={args.scale}' if args.detector == 'numpy' else ''
+        sampling = 'adaptive' if args.adaptive else ",".join(str(o // 60) for o in offsets)
+        return f'{args.detector}{scale}:skip={skip}:limit={limit}:offsets={sampling}'
+
+    jobs: List[Job] = []
+    outputs: Dict[Tuple[int, int, int], Tuple[dict, Path, dict]] = {}
+    remaining: Dict[Tuple[int, int, int], int] = defaultdict(int)
+    for idx, res in enumerate(results):
         if 'Aspect Ratio' not in res:
             logger.info(f'Ignoring {res}')
             continue
 
         res['Filename (path)'] = res['Filename (path)'].replace(lib_p, real_p).replace('\\', '/')
 
+        if res['File Type'] != 'bdmv':
+            continue
+
+        try:
+            stream = locator.find(res['Filename (path)'])
+        except:
+            logger.exception(f'[{res["Name"]} Unexpected failure')
+            continue
+        if not stream:
+            logger.error(f'[{res["Name"]}] No files found')
+            continue
+
+        wanted = []
         for skip in skips:
             for limit in limits:
                 output_file = Path(res['Filename (path)']) / f'crop_{limit}_{skip}.csv'
-                if output_file.exists():
-                    mtime = output_file.stat().st_mtime
-                    delta = mtime - min_mtime
-                    if delta > 0:
-                        logger.info(f'Skipping {res["Filename (path)"]}, recent crop data already present')
-                        continue
-                    else:
-                        logger.info(f'Overwriting {output_file}, last modified at {datetime.fromtimestamp(mtime).strftime("%c")}')
+                if not args.rescan and manifest.is_current(res['Key'], stream, params_id(skip, limit)):
+                    logger.debug(f'Skipping {output_file}, already scanned')
+                    continue
+                wanted.append((skip, limit, output_file))
+        if not wanted:
+            continue
 
+        logger.info(f'[{res["Name"]}] Main stream is {stream["path"]}')
+        disk = disk_of(stream['path'])
+        for skip, limit, output_file in wanted:
+            outputs[(idx, skip, limit)] = (res, output_file, stream)
+        if args.single_decode or args.detector == 'numpy' or args.adaptive:
+            params = [[(skip, limit) for skip, limit, _ in wanted]]
+        else:
+            params = [[(skip, limit)] for skip, limit, _ in wanted]
+        for p in params:
+            if args.adaptive:
                 try:
-                    if res['File Type'] == 'bdmv':
-                        sz, fn = find_largest(res)
-                        if fn:
-                            logger.info(f'[{res["Name"]}] Largest file is {fn.path}')
-                            crop_info = crop(res, skip, limit)
-                            if crop_info:
-                                dump_output(crop_info, res, output_file)
-                            else:
-                                logger.warning(f'[{res["Name"]}] No crop info found in any segment')
-                        else:
-                            logger.error(f'[{res["Name"]}] No files found')
-                except:
-                    logger.exception(f'[{res["Name"]} Unexpected failure')
+                    duration = float(res.get('Duration', 0))
+                except ValueError:
+                    duration = None
+                title_jobs = [Job(disk, adaptive_crop, (detector, res['Name'], stream['path'], p, duration),
+                                  (idx, tuple(p)))]
+            else:
+                title_jobs = [Job(disk, detector, (res['Name'], stream['path'], p, offset), (idx, tuple(p)))
+                              for offset in offsets]
+            for skip, limit in p:
+                remaining[(idx, skip, limit)] += len(title_jobs)
+            jobs.extend(title_jobs)
+
+    locator.save()
+
+    logger.info(f'Scheduling {len(jobs)} cropdetect jobs for {len(outputs)} outputs')
+    crop_infos: Dict[Tuple[int, int, int], List[dict]] = defaultdict(list)
+    failed: Set[Tuple[int, int, int]] = set()
+    scheduler = Scheduler(workers=args.workers, per_disk=args.per_disk, use_processes=args.processes)
+    store = CropStore(default_path(real_p))
+    for job, future in scheduler.run(jobs):
+        idx, params = job.tag
+        try:
+            for (skip, limit), c in future.result().items():
+                crop_infos[(idx, skip, limit)].extend(c)
+        except:
+            logger.exception(f'[{results[idx]["Name"]} Unexpected failure')
+            failed.update((idx, skip, limit) for skip, limit in params)
+        for skip, limit in params:
+            key = (idx, skip, limit)
+            remaining[key] -= 1
+            if remaining[key] == 0:
+                res, output_file, stream = outputs[key]
+                crop_info = sorted(crop_infos.pop(key, []), key=lambda c: c['ts'])
+                if key in failed:
+                    # replacing would swap the previous complete set of samples for a partial one
+                    logger.warning(f'[{res["Name"]}] Keeping existing samples as not every segment completed')
+                    continue
+                if crop_info:
+                    store.replace(res, skip, limit, crop_info)
+                    if args.csv:
+                        dump_output(crop_info, res, output_file)
+                    else:
+                        log_match(crop_info, res)
+                else:
+                    logger.warning(f'[{res["Name"]}] No crop info found in any segment')
+                manifest.mark_done(res['Key'], stream, params_id(skip, limit))
 
+    store.close()
     logger.info(f'Processed {len(results)} tracks')
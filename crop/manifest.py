@@ -0,0 +1,50 @@
+import json
+import os
+import sys
+from pathlib import Path
+from typing import Dict, Optional
+
+
+class ScanManifest:
+    """
+    Records which parameter sets have been scanned against which version of each title's main stream so a rescan
+    only visits new or changed titles and an interrupted run picks up from the last completed output.
+    """
+
+    def __init__(self, path: Path):
+        self.__path = path
+        self.__entries: Dict[str, dict] = {}
+        if path.exists():
+            try:
+                with path.open(mode='r', encoding='utf-8') as f:
+                    self.__entries = json.load(f)
+            except ValueError:
+                print(f'Ignoring corrupt manifest {path}', file=sys.stderr)
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def is_current(self, key: str, stream: dict, params_id: str) -> bool:
+        """
+        :param key: the title key.
+        :param stream: the current state of the stream that would be scanned.
+        :param params_id: identifies the detector parameters.
+        :return: true if this stream has already been scanned with these parameters.
+        """
+        entry = self.__entries.get(str(key), None)
+        return entry is not None and entry['stream'] == stream and params_id in entry['done']
+
+    def mark_done(self, key: str, stream: dict, params_id: str):
+        entry: Optional[dict] = self.__entries.get(str(key), None)
+        if entry is None or entry['stream'] != stream:
+            entry = {'stream': stream, 'done': []}
+            self.__entries[str(key)] = entry
+        if params_id not in entry['done']:
+            entry['done'].append(params_id)
+        self.save()
+
+    def save(self):
+        tmp = self.__path.with_suffix('.tmp')
+        with tmp.open(mode='w', encoding='utf-8') as f:
+            json.dump(self.__entries, f)
+        os.replace(tmp, self.__path)
@@ -0,0 +1,80 @@
+import logging
+import os
+import shlex
+import subprocess
+import threading
+import time
+from typing import Callable, NamedTuple, Optional
+
+logger = logging.getLogger('runner')
+
+
+class RunStats(NamedTuple):
+    wall: float
+    cpu: Optional[float]
+    returncode: int
+    stopped_early: bool
+
+
+def _reap(proc: subprocess.Popen) -> Optional[float]:
+    """
+    Waits for the process to exit, via wait4 where available so the CPU time of this child alone can be reported.
+    :return: user + system CPU time if known.
+    """
+    if hasattr(os, 'wait4'):
+        try:
+            _, status, usage = os.wait4(proc.pid, 0)
+            proc.returncode = os.waitstatus_to_exitcode(status)
+            return usage.ru_utime + usage.ru_stime
+        except ChildProcessError:
+            pass
+    proc.wait()
+    return None
+
+
+def stream_it(name: str, cmd: str, on_line: Callable[[str], bool], timeout: Optional[float] = None) -> RunStats:
+    """
+    Runs a command passing each line of its (merged) output to on_line as it is written.
+    :param name: the name of the command for logging.
+    :param cmd: the command.
+    :param on_line: called with each line, returning True stops the process.
+    :param timeout: max seconds to allow the command to run for.
+    :return: timing information for the invocation.
+    """
+    logger.debug(f'Executing {cmd}')
+    before = time.perf_counter()
+    proc = subprocess.Popen(shlex.split(cmd), stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                            stderr=subprocess.STDOUT, text=True, errors='replace')
+    timed_out = threading.Event()
+
+    def expire():
+        timed_out.set()
+        proc.kill()
+
+    timer = threading.Timer(timeout, expire) if timeout else None
+    stopped_early = False
+    try:
+        if timer:
+            timer.start()
+        for line in proc.stdout:
+            if on_line(line.rstrip('\n')):
+                stopped_early = True
+                proc.terminate()
+                break
+    except:
+        proc.kill()
+        logger.exception(f'{name} Unexpected failure')
+        raise
+    finally:
+        if timer:
+            timer.cancel()
+        proc.stdout.close()
+        cpu = _reap(proc)
+    stats = RunStats(time.perf_counter() - before, cpu, proc.returncode, stopped_early)
+    logger.debug(f'{name} took {stats.wall:.3f}s wall, {"?" if cpu is None else f"{cpu:.3f}"}s cpu')
+    if timed_out.is_set():
+        raise subprocess.TimeoutExpired(cmd, timeout)
+    if proc.returncode != 0 and not stopped_early:
+        logger.error(f'{name} failed with {proc.returncode}')
+        raise subprocess.CalledProcessError(proc.returncode, cmd)
+    return stats
@@ -0,0 +1,80 @@
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Tuple
+
+# minute offsets used before sampling was driven by the title duration
+FIXED_OFFSETS = [5 * 60, 12 * 60, 22 * 60, 38 * 60, 42 * 60]
+
+
+class AdaptiveSampler:
+    """
+    Chooses sample positions for a title from its duration, starting with a few samples spread evenly across the
+    title (ignoring the opening and closing margin where logos and credits live) and only adding more, between
+    samples which disagree, when the detected crops differ.
+    """
+
+    def __init__(self, duration: Optional[float], initial: int = 3, max_samples: int = 9, margin: float = 0.05,
+                 min_gap: float = 60, sample_length: float = 2):
+        self.__duration = duration
+        self.__initial = initial
+        self.__max_samples = max_samples
+        self.__margin = margin
+        self.__min_gap = min_gap
+        self.__sample_length = sample_length
+
+    def initial_offsets(self) -> List[int]:
+        """
+        :return: the first round of sample positions in seconds.
+        """
+        if not self.__duration:
+            return list(FIXED_OFFSETS)
+        start = self.__duration * self.__margin
+        span = self.__duration * (1 - 2 * self.__margin) - self.__sample_length
+        if span <= 0:
+            return [0]
+        return sorted({int(start + span * (i + 1) / (self.__initial + 1)) for i in range(self.__initial)})
+
+    def next_offsets(self, crops: Dict[int, Tuple[str, ...]]) -> List[int]:
+        """
+        :param crops: the crop(s) detected at each position sampled so far.
+        :return: positions to sample next, empty if the estimates have converged or the sample budget is spent.
+        """
+        budget = self.__max_samples - len(crops)
+        if budget <= 0 or len(set(crops.values())) <= 1:
+            return []
+        offsets = sorted(crops.keys())
+        refine = []
+        for lo, hi in zip(offsets, offsets[1:]):
+            if crops[lo] != crops[hi] and hi - lo > self.__min_gap:
+                refine.append((lo + hi) // 2)
+        return refine[:budget]
+
+
+def modal_crop(crop_info: List[dict]) -> str:
+    return Counter(c['crop'] for c in crop_info).most_common(1)[0][0] if crop_info else ''
+
+
+def adaptive_crop(detector: Callable, name: str, path: str, params: List[Tuple[int, int]], duration: Optional[float],
+                  initial: int = 3, max_samples: int = 9) -> Dict[Tuple[int, int], List[dict]]:
+    """
+    Samples a title until the crop estimates at each position agree (or the sample budget runs out).
+    :param detector: cropdetect.crop or blackbars.crop.
+    :param name: the title name.
+    :param path: the stream to sample.
+    :param params: the (skip, limit) pairs to evaluate.
+    :param duration: the title duration in seconds.
+    :param initial: the no of samples to take before checking for convergence.
+    :param max_samples: the max no of samples to take.
+    :return: crop info by (skip, limit).
+    """
+    sampler = AdaptiveSampler(duration, initial=initial, max_samples=max_samples)
+    crop_info = {p: [] for p in params}
+    crops: Dict[int, Tuple[str, ...]] = {}
+    offsets = sampler.initial_offsets()
+    while offsets:
+        for offset in offsets:
+            sample = detector(name, path, params, offset)
+            for p in params:
+                crop_info[p].extend(sample[p])
+            crops[offset] = tuple(modal_crop(sample[p]) for p in params)
+        offsets = sampler.next_offsets(crops)
+    return crop_info
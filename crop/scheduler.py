@@ -0,0 +1,71 @@
+import os
+from collections import deque, defaultdict
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from pathlib import Path
+from typing import Callable, Deque, Dict, Hashable, Iterable, Iterator, NamedTuple, Tuple
+
+
+class Job(NamedTuple):
+    disk: Hashable
+    func: Callable
+    args: tuple
+    tag: Hashable = None
+
+
+def disk_of(path: str) -> Hashable:
+    """
+    :param path: a path.
+    :return: an identifier for the device holding the path, jobs on the same device share an I/O budget.
+    """
+    try:
+        return os.stat(path).st_dev
+    except OSError:
+        return Path(path).anchor
+
+
+class Scheduler:
+    """
+    Runs jobs on a thread or process pool while capping the no of jobs in flight against any one disk, disks are
+    serviced round robin so a slow disk does not starve the others.
+    """
+
+    def __init__(self, workers: int = os.cpu_count(), per_disk: int = 2, use_processes: bool = False):
+        self.__workers = max(1, workers)
+        self.__per_disk = max(1, per_disk)
+        self.__use_processes = use_processes
+
+    def __create_executor(self) -> Executor:
+        if self.__use_processes:
+            return ProcessPoolExecutor(max_workers=self.__workers)
+        return ThreadPoolExecutor(max_workers=self.__workers, thread_name_prefix='crop')
+
+    def run(self, jobs: Iterable[Job]) -> Iterator[Tuple[Job, Future]]:
+        """
+        :param jobs: the jobs to run.
+        :return: each job along with its completed future, in completion order.
+        """
+        pending: Dict[Hashable, Deque[Job]] = defaultdict(deque)
+        for job in jobs:
+            pending[job.disk].append(job)
+        in_flight_by_disk: Dict[Hashable, int] = defaultdict(int)
+        in_flight: Dict[Future, Job] = {}
+        with self.__create_executor() as executor:
+            while pending or in_flight:
+                submitted = True
+                while submitted and len(in_flight) < self.__workers:
+                    submitted = False
+                    for disk in list(pending.keys()):
+                        if len(in_flight) >= self.__workers:
+                            break
+                        if in_flight_by_disk[disk] < self.__per_disk:
+                            job = pending[disk].popleft()
+                            if not pending[disk]:
+                                del pending[disk]
+                            in_flight[executor.submit(job.func, *job.args)] = job
+                            in_flight_by_disk[disk] += 1
+                            submitted = True
+                done, _ = wait(in_flight.keys(), return_when=FIRST_COMPLETED)
+                for f in done:
+                    job = in_flight.pop(f)
+                    in_flight_by_disk[job.disk] -= 1
+                    yield job, f
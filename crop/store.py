@@ -0,0 +1,130 @@
+import csv
+import sqlite3
+import sys
+from pathlib import Path
+from typing import List, Optional
+
+import pandas as pd
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS crop_sample (
+    key TEXT NOT NULL,
+    name TEXT,
+    imdbid TEXT,
+    dimensions TEXT,
+    skip INTEGER NOT NULL,
+    "limit" INTEGER NOT NULL,
+    ts REAL NOT NULL,
+    w INTEGER NOT NULL,
+    h INTEGER NOT NULL,
+    x INTEGER NOT NULL,
+    y INTEGER NOT NULL,
+    crop TEXT NOT NULL,
+    ar REAL,
+    mc_crop TEXT,
+    mc_ar TEXT,
+    match INTEGER
+);
+CREATE INDEX IF NOT EXISTS crop_sample_key ON crop_sample (key, skip, "limit");
+'''
+INSERT = 'INSERT INTO crop_sample (key, name, imdbid, dimensions, skip, "limit", ts, w, h, x, y, crop, ar, mc_crop, ' \
+         'mc_ar, match) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)'
+
+
+def default_path(real_p: str) -> Path:
+    return Path(real_p) / 'crop_samples.db'
+
+
+class CropStore:
+    """
+    Single table of every cropdetect sample across the library, replaces the per title crop_{limit}_{skip}.csv files
+    so analysis is one query rather than thousands of small file reads.
+    """
+
+    def __init__(self, path: Path):
+        self.__path = path
+        self.__conn = sqlite3.connect(str(path))
+        # the db lives alongside the library which is typically a network share where WAL is unsafe, WAL also sticks
+        # to the file once set so explicitly switch back to the default rollback journal
+        self.__conn.execute('PRAGMA journal_mode=DELETE')
+        self.__conn.executescript(SCHEMA)
+
+    def close(self):
+        self.__conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def replace(self, res: dict, skip: int, limit: int, crop_info: List[dict]):
+        """
+        Replaces all samples for this title and parameter set.
+        :param res: the MC item.
+        :param skip: the cropdetect skip.
+        :param limit: the cropdetect limit.
+        :param crop_info: the samples.
+        """
+        rows = [(str(res['Key']), res['Name'], res.get('IMDb ID', None), res.get('Dimensions', None), skip, limit,
+                 c['ts'], c['w'], c['h'], c['x'], c['y'], c['crop'], float(c['ar']), res.get('Video Crop', None),
+                 res.get('Aspect Ratio', None), c['crop'] == res.get('Video Crop', None))
+                for c in crop_info]
+        with self.__conn:
+            self.__conn.execute('DELETE FROM crop_sample WHERE key = ? AND skip = ? AND "limit" = ?',
+                                (str(res['Key']), skip, limit))
+            self.__conn.executemany(INSERT, rows)
+
+    def set_imdb(self, key: str, imdb_id: str) -> int:
+        """
+        Fills in the IMDb ID for a title where it is missing.
+        :return: the no of rows updated.
+        """
+        with self.__conn:
+            return self.__conn.execute("UPDATE crop_sample SET imdbid = ? WHERE key = ? AND (imdbid IS NULL OR imdbid = '')",
+                                       (imdb_id, str(key))).rowcount
+
+    def keys(self) -> List[str]:
+        return [r[0] for r in self.__conn.execute('SELECT DISTINCT key FROM crop_sample')]
+
+    def samples(self, key: Optional[str] = None) -> pd.DataFrame:
+        """
+        :param key: restrict to a single title, if set.
+        :return: the samples with typed columns.
+        """
+        sql = 'SELECT * FROM crop_sample'
+        params = ()
+        if key is not None:
+            sql = f'{sql} WHERE key = ?'
+            params = (str(key),)
+        df = pd.read_sql_query(sql, self.__conn, params=params)
+        df['match'] = df['match'].astype(bool)
+        return df
+
+    def import_csv(self, csv_file: Path, dimensions: Optional[str] = None) -> int:
+        """
+        Loads a legacy crop_{limit}_{skip}.csv file.
+        :return: the no of samples imported.
+        """
+        _, limit, skip = csv_file.stem.split('_')
+        with csv_file.open(mode='r') as f:
+            rows = list(csv.DictReader(f))
+        if not rows:
+            return 0
+        res = {'Key': rows[0]['key'], 'Name': rows[0]['name'], 'IMDb ID': rows[0]['imdbid'] or None,
+               'Dimensions': dimensions, 'Video Crop': rows[0]['mc_crop'], 'Aspect Ratio': rows[0]['mc_ar']}
+        self.replace(res, int(skip), int(limit),
+                     [{k: (float(v) if k == 'ts' else int(v) if k in ('w', 'h', 'x', 'y') else v) for k, v in r.items()}
+                      for r in rows])
+        return len(rows)
+
+
+if __name__ == '__main__':
+    # one off migration of existing csv files found beneath real_p
+    real_p = sys.argv[1]
+    with CropStore(default_path(real_p)) as store:
+        count = 0
+        for f in Path(real_p).rglob('crop_*_*.csv'):
+            if all(t.isdigit() for t in f.stem.split('_')[1:]):
+                count += store.import_csv(f)
+        print(f'Imported {count} samples, store now holds {len(store.keys())} titles')
@@ -0,0 +1,129 @@
+import json
+import os
+import sys
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, Optional
+
+
+def playlist_clips(mpls: Path) -> Dict[str, int]:
+    """
+    Parses the play items from a blu-ray MPLS file.
+    :param mpls: the playlist.
+    :return: the total duration (in 45kHz ticks) of each clip referenced by the playlist.
+    """
+    data = mpls.read_bytes()
+    clips = defaultdict(int)
+    if data[:4] != b'MPLS':
+        return clips
+    start = int.from_bytes(data[8:12], 'big')
+    item_count = int.from_bytes(data[start + 6:start + 8], 'big')
+    pos = start + 10
+    for _ in range(item_count):
+        length = int.from_bytes(data[pos:pos + 2], 'big')
+        item = data[pos + 2:pos + 2 + length]
+        in_time = int.from_bytes(item[12:16], 'big')
+        out_time = int.from_bytes(item[16:20], 'big')
+        clips[item[0:5].decode('ascii')] += out_time - in_time
+        pos += 2 + length
+    return clips
+
+
+def main_playlist_clip(bdmv: Path) -> Optional[Path]:
+    """
+    :param bdmv: the BDMV directory.
+    :return: the clip which makes up most of the longest playlist.
+    """
+    longest = 0
+    clip = None
+    with os.scandir(bdmv / 'PLAYLIST') as it:
+        for f in it:
+            if f.is_file() and f.name.lower().endswith('mpls'):
+                try:
+                    clips = playlist_clips(Path(f.path))
+                except (OSError, ValueError, IndexError):
+                    continue
+                duration = sum(clips.values())
+                if clips and duration > longest:
+                    longest = duration
+                    clip = max(clips.items(), key=lambda c: c[1])[0]
+    return bdmv / 'STREAM' / f'{clip}.m2ts' if clip else None
+
+
+def largest_stream(bdmv: Path) -> Optional[Path]:
+    sz = 0
+    fn = None
+    with os.scandir(str((bdmv / 'STREAM').absolute())) as it:
+        for f in it:
+            if f.is_file() and f.name.endswith('m2ts'):
+                f_sz = f.stat().st_size
+                if f_sz > sz:
+                    sz = f_sz
+                    fn = f.path
+    return Path(fn) if fn else None
+
+
+def stream_info(stream: Path) -> dict:
+    """
+    :param stream: the stream.
+    :return: path, size and mtime of the stream.
+    """
+    st = stream.stat()
+    return {'path': str(stream), 'size': st.st_size, 'mtime': st.st_mtime}
+
+
+class StreamLocator:
+    """
+    Finds the main stream of each BDMV title, either the largest m2ts or the main clip of the longest playlist, and
+    caches which file that is until the mtime of the directory it was found from changes. The size and mtime of the
+    stream itself are always read afresh.
+    """
+
+    def __init__(self, cache_file: Path, use_playlist: bool = False):
+        self.__cache_file = cache_file
+        self.__use_playlist = use_playlist
+        self.__cache: Dict[str, dict] = {}
+        self.__dirty = False
+        if cache_file.exists():
+            try:
+                with cache_file.open(mode='r', encoding='utf-8') as f:
+                    self.__cache = json.load(f)
+            except ValueError:
+                print(f'Ignoring corrupt stream cache {cache_file}', file=sys.stderr)
+
+    def find(self, bdmv: str) -> Optional[dict]:
+        """
+        :param bdmv: the BDMV directory.
+        :return: path, size and mtime of the main stream.
+        """
+        bdmv_p = Path(bdmv)
+        source_dir = bdmv_p / ('PLAYLIST' if self.__use_playlist else 'STREAM')
+        cache_key = f'{"mpls" if self.__use_playlist else "size"}:{bdmv}'
+        dir_mtime = source_dir.stat().st_mtime
+        cached = self.__cache.get(cache_key, None)
+        if cached and cached['dir_mtime'] == dir_mtime:
+            if cached['stream'] is None:
+                return None
+            # overwriting the stream in place leaves the directory mtime alone so always restat the stream itself
+            try:
+                stream = stream_info(Path(cached['stream']['path']))
+            except OSError:
+                stream = None
+            if stream:
+                if stream != cached['stream']:
+                    cached['stream'] = stream
+                    self.__dirty = True
+                return stream
+        stream_p = main_playlist_clip(bdmv_p) if self.__use_playlist else largest_stream(bdmv_p)
+        stream = stream_info(stream_p) if stream_p else None
+        self.__cache[cache_key] = {'dir_mtime': dir_mtime, 'stream': stream}
+        self.__dirty = True
+        return stream
+
+    def save(self):
+        if self.__dirty:
+            tmp = self.__cache_file.with_suffix('.tmp')
+            with tmp.open(mode='w', encoding='utf-8') as f:
+                json.dump(self.__cache, f)
+            os.replace(tmp, self.__cache_file)
+            self.__dirty = False
@@ -0,0 +1,45 @@
+import unittest
+
+import numpy as np
+
+from blackbars import detect
+
+W = 1920
+H = 1080
+
+
+def line_sums(first: int, last: int, frames: int = 3, level: int = 100):
+    """
+    :return: row and column sums of frames which are black apart from rows first to last (inclusive) at level.
+    """
+    frame = np.zeros((H, W), dtype=np.int64)
+    frame[first:last + 1] = level
+    return np.stack([frame.sum(axis=1)] * frames), np.stack([frame.sum(axis=0)] * frames)
+
+
+class DetectTest(unittest.TestCase):
+
+    def __box(self, info: dict) -> str:
+        return f'{info["w"]}:{info["h"]}:{info["x"]}:{info["y"]}'
+
+    def test_odd_start_is_rounded_before_the_size_is_taken(self):
+        # ffmpeg cropdetect=limit=24:round=16:skip=0 reports 1920:800:0:140 for the same frames
+        rows, cols = line_sums(131, 946)
+        crops = detect(rows, cols, W, H, 24.0, 0, 0, 24)
+        self.assertEqual([self.__box(c) for c in crops], ['1920:800:0:140'] * 3)
+        self.assertEqual(crops[0]['crop'], '0x140x1920x940')
+
+    def test_even_start(self):
+        rows, cols = line_sums(140, 939)
+        self.assertEqual(self.__box(detect(rows, cols, W, H, 24.0, 0, 0, 24)[-1]), '1920:800:0:140')
+
+    def test_skipped_frames_are_not_reported(self):
+        rows, cols = line_sums(131, 946, frames=5)
+        crops = detect(rows, cols, W, H, 24.0, 10, 2, 24)
+        self.assertEqual(len(crops), 3)
+        self.assertEqual(crops[0]['ts'], round(10 + 2 / 24, 6))
+        self.assertEqual(detect(rows, cols, W, H, 24.0, 10, 5, 24), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
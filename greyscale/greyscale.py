@@ -3,17 +3,17 @@ import shlex
 import subprocess
 
 import numpy as np
-import png
 
-from colour.models import eotf_inverse_ST2084, eotf_ST2084
+from colour.models import eotf_inverse_ST2084
 
+from luts import eotf_lut
 
-def encode(cmd: str, file_1: str, file_60: str):
+
+def encode(cmd: str, file_1: str, file_60: str, frame: bytes):
     if not os.path.exists(file_1):
         print(f'Writing {file_1}')
         print(cmd)
-        shlex.split(cmd)
-        subprocess.run(shlex.split(cmd), check=True)
+        subprocess.run(shlex.split(cmd), input=frame, check=True)
 
     if not os.path.exists(file_60):
         cmd = f"ffmpeg -y -stream_loop 60 -i {file_1} -c copy -map_chapters -1 {file_60}"
@@ -41,55 +41,37 @@ abs_s_max = eotf_inverse_ST2084(abs_max_nits)
 s_max = eotf_inverse_ST2084(max_nits)
 
 rgb_max_value = (2 ** scale) - 1
+pq_nits = eotf_lut('pq', scale)
 max_value = int(rgb_max_value * s_max)
-pixels = []
 
-cols = list(range(0, steps + 1))
-rows = 1
+cols = np.arange(0, steps + 1)
 
 panel_width = int(w / len(cols))
 width_padding = w - (panel_width * len(cols))
 
-row = []
-eotf_y_values = []
-for patch_num in cols:
-    pq_val = s_max / 100 * patch_num
-    multiplier = rgb_max_value
-    rgb_value = int(pq_val * multiplier)
-    rgb_triplet = [rgb_value] * 3
-    column_width = panel_width + (0 if patch_num != len(cols) - 1 else width_padding)
-    pixels = rgb_triplet * column_width
-    row.extend(pixels)
-
-    eotf_y = eotf_ST2084(pq_val)
-    eotf_y_values.extend([eotf_y] * column_width)
+rgb_values = (s_max / 100 * cols * rgb_max_value).astype(np.uint16)
+widths = np.full(len(cols), panel_width)
+widths[-1] += width_padding
+eotf_y_values = pq_nits[rgb_values]
+for patch_num, rgb_value, eotf_y in zip(cols, rgb_values, eotf_y_values):
     print(f'{patch_num},{rgb_value},{eotf_y:.6g}')
 
-print(f'{np.mean(np.array(eotf_y_values))}')
-
-pixels = [row for _ in range(h)]
-
-
-# one line version
-# row = [v for g in cols for v in
-#        [0 if g == 0 else int((g / 100) * max_value)] * 3 * (panel_width + (0 if g != len(cols) - 1 else width_padding))]
+print(f'{np.average(eotf_y_values, weights=widths)}')
 
-ramp_file = f'greyscale_{steps}_{max_nits}.png'
+# every row is the same so broadcast a single row of patches to the full frame
+row = np.repeat(rgb_values, widths)
+frame = np.broadcast_to(row[None, :, None], (h, w, 3)).astype('<u2').tobytes()
 
-if not os.path.exists(ramp_file):
-    print(f'Writing {ramp_file}')
-    with open(ramp_file, 'wb') as f:
-        w = png.Writer(w, h, greyscale=False, bitdepth=scale)
-        w.write(f, pixels)
+raw_input = f"-f rawvideo -pix_fmt rgb48le -s {w}x{h} -framerate 24000/1001 -i -"
 
 x265_params = "crf=12:colorprim=bt2020:transfer=smpte2084:colormatrix=bt2020nc:master-display=\"G(13250,34500)B(7500,3000)R(34000,16000)WP(15635,16450)L(10000000,1)\":max-cll=\"1000,400\""
 vf_params = f"scale=out_color_matrix=bt2020:out_h_chr_pos=0:out_v_chr_pos=0,format=yuv420p10,loop=-1:1"
 hdr_file_1 = f'greyscale_{steps}_{max_nits}_1.mkv'
-cmd = f"ffmpeg -y -framerate 24000/1001 -i {ramp_file} -c:v libx265 -x265-params \"{x265_params}\" -t 1 -vf \"{vf_params}\" {hdr_file_1}"
+cmd = f"ffmpeg -y {raw_input} -c:v libx265 -x265-params \"{x265_params}\" -t 1 -vf \"{vf_params}\" {hdr_file_1}"
 
-encode(cmd, hdr_file_1, f'greyscale_{steps}_{max_nits}.mkv')
+encode(cmd, hdr_file_1, f'greyscale_{steps}_{max_nits}.mkv', frame)
 
 sdr_file_1 = f'greyscale_{steps}_{max_nits}_sdr_1.mkv'
-cmd = f"ffmpeg -y -framerate 24000/1001 -i {ramp_file} -c:v libx265 -x265-params \"lossless=1\" -t 1 -vf \"colorspace=all=bt709:iall=bt601-6-625:fast=1:format=yuv420p10,loop=-1:1\" -colorspace 1 -color_primaries 1 -color_trc 1 -sws_flags accurate_rnd+full_chroma_int {sdr_file_1}"
+cmd = f"ffmpeg -y {raw_input} -c:v libx265 -x265-params \"lossless=1\" -t 1 -vf \"colorspace=all=bt709:iall=bt601-6-625:fast=1:format=yuv420p10,loop=-1:1\" -colorspace 1 -color_primaries 1 -color_trc 1 -sws_flags accurate_rnd+full_chroma_int {sdr_file_1}"
 
-encode(cmd, sdr_file_1, f'greyscale_{steps}_{max_nits}_sdr.mkv')
+encode(cmd, sdr_file_1, f'greyscale_{steps}_{max_nits}_sdr.mkv', frame)
@@ -1,8 +1,8 @@
-import os
-import shlex
-import subprocess
+from concurrent.futures import ProcessPoolExecutor
 
+import numpy as np
 import pandas as pd
+import png
 
 bn = '/media/home-media/docs/calibration/tonemapping/greyscale/greyscale_'
 steps = 100
@@ -24,25 +24,40 @@ pngs = [
 ]
 
 columns = ['percent', 'r', 'g', 'b', 'avg', 'x_pos']
-for spline in pngs:
+
+
+def read_png(file: str) -> np.ndarray:
+    """
+    :param file: the screenshot.
+    :return: the image as a height x width x rgb array normalised to 0-1.
+    """
+    w, h, rows, info = png.Reader(filename=file).asDirect()
+    planes = info['planes']
+    img = np.vstack([np.asarray(r, dtype=np.uint16) for r in rows]).reshape(h, w, planes)
+    if planes < 3:
+        img = np.repeat(img[..., :1], 3, axis=2)
+    return img[..., :3] / (2 ** info['bitdepth'] - 1)
+
+
+def extract(spline: str):
     pkl = f'{bn}{spline}.pkl'
     # if os.path.exists(pkl):
     #     print(f'{pkl} exists, skipping')
-    #     continue
-    values = []
-    for patch in range(steps + 1):
-        v = [patch]
-        x = int((panel_width / 2) + int(panel_width * patch))
-        cmd = f"convert {bn}{spline}.png -crop '10x{y * 2}+{x - 5}+{y}' -format '%[fx:r],%[fx:g],%[fx:b]' info:-"
-        print(f'>>> {patch} {cmd}')
-        shlex.split(cmd)
-        res = subprocess.run(shlex.split(cmd), check=True, capture_output=True)
-        out = res.stdout.decode().splitlines()
-        rgb = [float(f) for f in out[0].split(',')]
-        v = v + rgb
-        v.append(sum(rgb) / len(rgb))
-        v.append(x)
-        values.append(v)
+    #     return
+    img = read_png(f'{bn}{spline}.png')
+    patches = np.arange(steps + 1)
+    x = ((panel_width / 2) + (panel_width * patches)).astype(int)
+    # a 10 x (height / 2) strip centred on each patch, at 3840 wide the last patch is centred on x=3819 so its strip
+    # (3814-3823) is inside the frame, the clip only guards other widths or step counts
+    strips = np.clip(x[:, None] + np.arange(-5, 5), 0, img.shape[1] - 1)
+    rgb = img[y:y * 3][:, strips].mean(axis=(0, 2))
+    df = pd.DataFrame(data=np.column_stack([patches, rgb, rgb.mean(axis=1), x]), columns=columns)
+    df = df.astype({'percent': int, 'x_pos': int})
     print(f'Pickling {pkl}')
-    df = pd.DataFrame(data=values, columns=columns)
     df.to_pickle(pkl)
+
+
+if __name__ == '__main__':
+    with ProcessPoolExecutor() as executor:
+        for _ in executor.map(extract, pngs):
+            pass
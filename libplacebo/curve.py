@@ -1,81 +1,141 @@
-from matplotlib import pyplot as plt
+import argparse
+
 import numpy as np
 from colour.models import eotf_inverse_ST2084, eotf_ST2084
 
-s_contrast = 0.5
-
-contrast_ratio = 30000
-d_max_nits = 100
-d_min_nits = d_max_nits / contrast_ratio
-
-s_max_nits = 1000
-
-s_min = 0.0
-s_avg = 0.3
-s_max = eotf_inverse_ST2084(s_max_nits)
-
-d_max = eotf_inverse_ST2084(d_max_nits)
-d_min = eotf_inverse_ST2084(d_min_nits)
-
-k_adaptation = 0.7
-k_min = 0.1
-k_max = 0.8
-
-t_strength = 1.5
-t_offset = 0.2
-
-t_knee = max(min(((s_avg - s_min) / (s_max - s_min)), k_max), k_min)
-s_knee = t_knee * (s_max - s_min) + s_min
-
-d_pre = t_knee * (d_max - d_min) + d_min
-d_kmin = k_min * d_max + (1 - k_min) * d_min
-d_kmax = k_max * d_max + (1 - k_max) * d_min
-
-d_knee = k_adaptation * d_pre + (1 - k_adaptation) * s_knee
-
-m_slope = (d_knee - d_min) / (s_knee - s_min)
-
-r = s_max / d_max - 1
-r_tuned = min(max(t_strength * r, t_offset), t_offset + 1)
-
-g_slope = 1 - s_contrast
-
-m = m_slope ** (g_slope * r_tuned)
-
-i_min = s_min - s_knee
-i_max = s_max - s_knee
-
-o_min = d_min - d_knee
-o_max = d_max - d_knee
-
-p_a = (o_min - (m * i_min)) / (i_min * i_min)
-p_b = m
-
-t = 2 * i_max * i_max
-
-q_a = (m * i_max - o_max) / (i_max * t)
-q_b = -3 * ((m * i_max - o_max) / t)
-q_c = m
-
-upper_range = np.arange(s_knee, s_max + 0.001, 0.001)
-upper_delta = upper_range - s_knee
-d_upper_1 = q_a * (upper_delta ** 3)
-d_upper_2 = q_b * (upper_delta ** 2)
-d_upper_3 = q_c * upper_delta
-d_upper = d_upper_1 + d_upper_2 + d_upper_3 + d_knee
-
-lower_range = np.arange(s_min, s_knee, 0.001)
-lower_delta = lower_range - s_knee
-d_lower_1 = p_a * (lower_delta ** 2)
-d_lower_2 = p_b * lower_delta
-d_lower = d_lower_1 + d_lower_2 + d_knee
-
-input_signal = np.concatenate((lower_range, upper_range))
-output_signal = np.concatenate((d_lower, d_upper))
-
-input_min = 0.0
-input_max = 0.8
-
-input_pq = eotf_inverse_ST2084(np.arange(0, 1, 0.001))
-input_nits_min = eotf_ST2084(input_min)
-input_nits_max = eotf_ST2084(input_max)
\ No newline at end of file
+CONTRAST_RATIO = 30000
+S_AVG = 0.3
+K_MIN = 0.1
+K_MAX = 0.8
+T_OFFSET = 0.2
+
+
+def signal(step: float = 0.001) -> np.ndarray:
+    """
+    :param step: the distance between each point.
+    :return: PQ signal values covering 0-1 inclusive.
+    """
+    return np.append(np.arange(0, 1, step), 1.0)
+
+
+def spline(x: np.ndarray, s_contrast=0.5, k_adaptation=0.7, t_strength=1.5, s_max_nits=1000, d_max_nits=100,
+           s_avg=S_AVG, contrast_ratio=CONTRAST_RATIO, k_min=K_MIN, k_max=K_MAX, t_offset=T_OFFSET) -> np.ndarray:
+    """
+    Evaluates the libplacebo spline tone curve for any number of parameter sets at once. Each parameter may be a
+    scalar or an array, the arrays are broadcast against each other to give the parameter grid.
+    :param x: the input PQ signal, clipped to the source range.
+    :param s_contrast: the slope tuning, 0 is linear through the knee.
+    :param k_adaptation: how far the knee point moves towards the source knee.
+    :param t_strength: the slope tuning strength, scaled by the ratio of source to display peak.
+    :param s_max_nits: the source peak.
+    :param d_max_nits: the display peak.
+    :param s_avg: the source average in PQ.
+    :param contrast_ratio: the display contrast ratio, determines the display black.
+    :return: the output PQ signal shaped as the parameter grid with a trailing axis of len(x).
+    """
+    # add a trailing axis to every parameter so the signal broadcasts along it
+    s_contrast, k_adaptation, t_strength, s_max_nits, d_max_nits, s_avg, contrast_ratio, k_min, k_max, t_offset = [
+        np.asarray(p, dtype=np.float64)[..., None]
+        for p in np.broadcast_arrays(s_contrast, k_adaptation, t_strength, s_max_nits, d_max_nits, s_avg,
+                                     contrast_ratio, k_min, k_max, t_offset)
+    ]
+    s_min = 0.0
+    s_max = eotf_inverse_ST2084(s_max_nits)
+    d_max = eotf_inverse_ST2084(d_max_nits)
+    d_min = eotf_inverse_ST2084(d_max_nits / contrast_ratio)
+
+    t_knee = np.clip((s_avg - s_min) / (s_max - s_min), k_min, k_max)
+    s_knee = t_knee * (s_max - s_min) + s_min
+    d_pre = t_knee * (d_max - d_min) + d_min
+    d_knee = k_adaptation * d_pre + (1 - k_adaptation) * s_knee
+
+    m_slope = (d_knee - d_min) / (s_knee - s_min)
+    r = s_max / d_max - 1
+    r_tuned = np.clip(t_strength * r, t_offset, t_offset + 1)
+    g_slope = 1 - s_contrast
+    m = m_slope ** (g_slope * r_tuned)
+
+    i_min = s_min - s_knee
+    i_max = s_max - s_knee
+    o_min = d_min - d_knee
+    o_max = d_max - d_knee
+
+    p_a = (o_min - (m * i_min)) / (i_min * i_min)
+    p_b = m
+
+    t = 2 * i_max * i_max
+    q_a = (m * i_max - o_max) / (i_max * t)
+    q_b = -3 * ((m * i_max - o_max) / t)
+    q_c = m
+
+    delta = np.clip(x, s_min, s_max) - s_knee
+    lower = (p_a * delta + p_b) * delta
+    upper = ((q_a * delta + q_b) * delta + q_c) * delta
+    return np.where(delta < 0, lower, upper) + d_knee
+
+
+def spline_nits(nits: np.ndarray, **params) -> np.ndarray:
+    """
+    :param nits: the input luminance.
+    :param params: spline parameters.
+    :return: the output luminance.
+    """
+    return eotf_ST2084(spline(eotf_inverse_ST2084(nits), **params))
+
+
+def write_cube_1d(file: str, size: int = 1024, title: str = 'spline', **params):
+    """
+    Writes a 1D .cube LUT which applies the curve to each channel of a PQ signal.
+    :param params: a single set of spline parameters.
+    """
+    x = np.linspace(0, 1, size)
+    y = spline(x, **params).reshape(size)
+    with open(file, mode='w') as f:
+        f.write(f'TITLE "{title}"\nLUT_1D_SIZE {size}\n')
+        np.savetxt(f, np.repeat(y[:, None], 3, axis=1), fmt='%.6f')
+
+
+def write_cube_3d(file: str, size: int = 33, title: str = 'spline', **params):
+    """
+    Writes a 3D .cube LUT which applies the curve to the max of the rgb values of a PQ signal and scales each channel
+    by the same amount in linear light, preserving hue.
+    :param params: a single set of spline parameters.
+    """
+    v = np.linspace(0, 1, size)
+    # .cube expects red to vary fastest
+    b, g, r = np.meshgrid(v, v, v, indexing='ij')
+    rgb = eotf_ST2084(np.stack([r, g, b], axis=-1).reshape(-1, 3))
+    max_rgb = rgb.max(axis=1)
+    mapped = spline_nits(max_rgb, **params).reshape(-1)
+    scale = np.divide(mapped, max_rgb, out=np.zeros_like(max_rgb), where=max_rgb > 0)
+    out = eotf_inverse_ST2084(rgb * scale[:, None])
+    with open(file, mode='w') as f:
+        f.write(f'TITLE "{title}"\nLUT_3D_SIZE {size}\n')
+        np.savetxt(f, out, fmt='%.6f')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='curve', description='Writes the libplacebo spline tone curve as a .cube LUT')
+    parser.add_argument('output', help='The .cube file to write')
+    parser.add_argument('-c', '--contrast', help='s_contrast', default=0.5, type=float)
+    parser.add_argument('-a', '--adaptation', help='k_adaptation', default=0.7, type=float)
+    parser.add_argument('-t', '--strength', help='t_strength', default=1.5, type=float)
+    parser.add_argument('-s', '--source-peak', help='Source peak in nits', default=1000, type=float)
+    parser.add_argument('-d', '--display-peak', help='Display peak in nits', default=100, type=float)
+    parser.add_argument('-r', '--contrast-ratio', help='Display contrast ratio', default=CONTRAST_RATIO, type=float)
+    parser.add_argument('-3', '--3d', dest='three_d', help='Write a 3D LUT', action='store_true')
+    parser.add_argument('-n', '--size', help='LUT size, defaults to 1024 (1D) or 33 (3D)', type=int)
+    args = parser.parse_args()
+
+    p = {
+        's_contrast': args.contrast,
+        'k_adaptation': args.adaptation,
+        't_strength': args.strength,
+        's_max_nits': args.source_peak,
+        'd_max_nits': args.display_peak,
+        'contrast_ratio': args.contrast_ratio
+    }
+    if args.three_d:
+        write_cube_3d(args.output, size=args.size or 33, **p)
+    else:
+        write_cube_1d(args.output, size=args.size or 1024, **p)
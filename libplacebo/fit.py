@@ -0,0 +1,139 @@
+import argparse
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import List, NamedTuple, Tuple
+
+import numpy as np
+import pandas as pd
+from colour.models import eotf_inverse_ST2084, eotf_ST2084
+from scipy.optimize import minimize
+
+from curve import spline
+from luts import EOTFS
+
+# name of each fitted parameter alongside the range searched
+BOUNDS = {
+    's_contrast': (0.0, 1.0),
+    'k_adaptation': (0.0, 1.0),
+    't_strength': (0.1, 5.0)
+}
+# the transfer the renderer output was encoded with, keyed by the suffix of the capture name
+LUT_TRANSFERS = {
+    'g22': 'gamma2.2',
+    'g24': 'gamma2.4',
+    'bt1886': 'bt1886'
+}
+
+
+class Capture(NamedTuple):
+    name: str
+    pq_in: np.ndarray
+    pq_out: np.ndarray
+    s_max_nits: float
+
+
+class Fit(NamedTuple):
+    params: Tuple[float, ...]
+    pq_rms: float
+    pq_max: float
+    nits_rms: float
+    nits_max: float
+
+
+def load_capture(pkl: str, d_max_nits: float) -> Capture:
+    """
+    Reads the per patch output extracted by greyscale_extract, the source peak and output transfer are taken from the
+    name of the capture as per the greyscale notebook.
+    :param pkl: the pickled DataFrame.
+    :param d_max_nits: the display peak the capture was taken at.
+    :return: the input and output PQ signal of each patch.
+    """
+    name = Path(pkl).stem
+    df = pd.read_pickle(pkl)
+    m = re.match(r".*peak(\d+)(_3dlut_(.*))?", name)
+    s_max_nits = int(m.group(1)) if m else 1000
+    transfer = LUT_TRANSFERS.get(m.group(3) if m else None, 'gamma2.2')
+    output = EOTFS[transfer]((0.2126 * df['r'] + 0.7152 * df['g'] + 0.0722 * df['b']).to_numpy()) * d_max_nits
+    pq_in = df['percent'].to_numpy() / 100 * eotf_inverse_ST2084(s_max_nits)
+    return Capture(name, pq_in, eotf_inverse_ST2084(output), s_max_nits)
+
+
+def pq_error(params: np.ndarray, capture: Capture, d_max_nits: float) -> np.ndarray:
+    """
+    :param params: parameter sets, shaped (n, len(BOUNDS)).
+    :param capture: the capture to compare against.
+    :param d_max_nits: the display peak.
+    :return: rms error in PQ between the curve and the capture for each parameter set.
+    """
+    params = np.atleast_2d(params)
+    predicted = spline(capture.pq_in, s_contrast=params[:, 0], k_adaptation=params[:, 1], t_strength=params[:, 2],
+                       s_max_nits=capture.s_max_nits, d_max_nits=d_max_nits)
+    return np.sqrt(np.mean((predicted - capture.pq_out) ** 2, axis=-1))
+
+
+def seed_grid(steps: int) -> np.ndarray:
+    """
+    :param steps: the no of points per parameter.
+    :return: every combination of evenly spaced points across BOUNDS, shaped (steps ** len(BOUNDS), len(BOUNDS)).
+    """
+    axes = [np.linspace(lo, hi, steps) for lo, hi in BOUNDS.values()]
+    return np.stack(np.meshgrid(*axes, indexing='ij'), axis=-1).reshape(-1, len(axes))
+
+
+def refine(seed: np.ndarray, capture: Capture, d_max_nits: float) -> Tuple[np.ndarray, float]:
+    res = minimize(lambda p: float(pq_error(p, capture, d_max_nits)[0]), seed, method='L-BFGS-B',
+                   bounds=list(BOUNDS.values()))
+    return res.x, float(res.fun)
+
+
+def fit(capture: Capture, d_max_nits: float, executor: ProcessPoolExecutor, workers: int, steps: int = 21,
+        seeds: int = 4) -> Fit:
+    """
+    Evaluates the whole seed grid, split across the pool, then refines the best seeds with a bounded optimiser.
+    :return: the best fit.
+    """
+    grid = seed_grid(steps)
+    chunks = np.array_split(grid, workers)
+    errors = np.concatenate(list(executor.map(pq_error, chunks, [capture] * len(chunks),
+                                              [d_max_nits] * len(chunks))))
+    best_seeds = grid[np.argsort(errors)[:seeds]]
+    refined = list(executor.map(refine, best_seeds, [capture] * seeds, [d_max_nits] * seeds))
+    params, pq_rms = min(refined, key=lambda r: r[1])
+    predicted = spline(capture.pq_in, s_contrast=params[0], k_adaptation=params[1], t_strength=params[2],
+                       s_max_nits=capture.s_max_nits, d_max_nits=d_max_nits)
+    pq_delta = np.abs(predicted - capture.pq_out)
+    nits_delta = np.abs(eotf_ST2084(predicted) - eotf_ST2084(capture.pq_out))
+    return Fit(tuple(float(p) for p in params), pq_rms, float(pq_delta.max()),
+               float(np.sqrt(np.mean(nits_delta ** 2))), float(nits_delta.max()))
+
+
+def fit_all(pkls: List[str], d_max_nits: float, workers: int, steps: int, seeds: int) -> pd.DataFrame:
+    workers = workers or os.cpu_count()
+    rows = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for pkl in pkls:
+            capture = load_capture(pkl, d_max_nits)
+            result = fit(capture, d_max_nits, executor, workers, steps=steps, seeds=seeds)
+            rows.append([capture.name, capture.s_max_nits, *result.params, result.pq_rms, result.pq_max,
+                         result.nits_rms, result.nits_max])
+    return pd.DataFrame(rows, columns=['name', 's_max_nits', *BOUNDS.keys(), 'pq_rms', 'pq_max', 'nits_rms',
+                                       'nits_max'])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='fit', description='Fits the libplacebo spline to greyscale captures')
+    parser.add_argument('pkls', nargs='+', help='DataFrames pickled by greyscale_extract')
+    parser.add_argument('-d', '--display-peak', help='Display peak in nits', default=100, type=float)
+    parser.add_argument('-w', '--workers', help='No of worker processes', type=int)
+    parser.add_argument('-g', '--grid-steps', help='No of seed points per parameter', default=21, type=int)
+    parser.add_argument('-s', '--seeds', help='No of seeds to refine', default=4, type=int)
+    parser.add_argument('-o', '--output', help='Write the fits to this csv file')
+    args = parser.parse_args()
+
+    fits = fit_all(args.pkls, args.display_peak, args.workers, args.grid_steps, args.seeds)
+    if args.output:
+        fits.to_csv(args.output, index=False)
+    with pd.option_context('display.max_columns', None, 'display.width', 200):
+        print(fits)
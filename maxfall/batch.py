@@ -0,0 +1,124 @@
+import argparse
+import csv
+import glob
+import importlib.util
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import List, Optional, Set
+
+import pandas as pd
+
+import stream
+from calc import load_luminance
+from histogram import PQHistogram
+
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.tif', '.tiff', '.bmp'}
+VIDEO_EXTENSIONS = {'.mkv', '.mp4', '.m2ts', '.ts', '.hevc', '.mov'}
+COLUMNS = ['Name', 'type', 'frames', 'MaxFALL', 'MaxCLL', 'FALL', 'APL %', 'P99.95', 'MAX', 'elapsed']
+
+
+def find_files(patterns: List[str]) -> List[str]:
+    """
+    :param patterns: globs, files or directories (searched recursively).
+    :return: every image or video matched, in a stable order.
+    """
+    extensions = IMAGE_EXTENSIONS | VIDEO_EXTENSIONS
+    found = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            found.update(str(p) for p in Path(pattern).rglob('*') if p.suffix.lower() in extensions)
+        else:
+            found.update(p for p in glob.glob(pattern, recursive=True) if Path(p).suffix.lower() in extensions)
+    return sorted(found)
+
+
+def analyse_file(path: str, gamma: Optional[float], bits: int, metric: str, scale: int) -> dict:
+    """
+    Analyses a single image or video, run in a worker process.
+    :return: a row of COLUMNS.
+    """
+    before = time.perf_counter()
+    if Path(path).suffix.lower() in VIDEO_EXTENSIONS:
+        # files are already spread across the pool so decode in this process rather than via stream.analyse which
+        # would start a pool of its own for every video
+        w, h, fps, _ = stream.probe(path)
+        frames, histo = stream.analyse_segment(path, 0, None, w, h, fps, bits=bits, metric=metric, scale=scale)
+        fall, apl, p9995, max_nits = histo.stats()
+        row = {'frames': len(frames),
+               'MaxFALL': frames[:, stream.FRAME_COLUMNS.index('FALL')].max(initial=0.0),
+               'MaxCLL': frames[:, stream.FRAME_COLUMNS.index('MAX')].max(initial=0.0),
+               'FALL': fall, 'APL %': apl, 'P99.95': p9995, 'MAX': max_nits, 'type': 'video'}
+    else:
+        _, luminance = load_luminance(path, gamma)
+        fall, apl, p9995, max_nits = PQHistogram(bits).add_signal(luminance).stats()
+        row = {'frames': 1, 'MaxFALL': fall, 'MaxCLL': max_nits, 'FALL': fall, 'APL %': apl, 'P99.95': p9995,
+               'MAX': max_nits, 'type': 'image'}
+    row['Name'] = path
+    row['elapsed'] = time.perf_counter() - before
+    return row
+
+
+def completed(journal: Path) -> Set[str]:
+    """
+    :param journal: the csv written by a previous run.
+    :return: the files already analysed.
+    """
+    if not journal.exists():
+        return set()
+    with journal.open(mode='r', newline='') as f:
+        return {row['Name'] for row in csv.DictReader(f)}
+
+
+def run(files: List[str], journal: Path, workers: int, gamma: Optional[float], bits: int, metric: str, scale: int):
+    done = completed(journal)
+    todo = [f for f in files if f not in done]
+    print(f'{len(files)} files, {len(done)} already analysed, {len(todo)} to go')
+    if not todo:
+        return
+    failed = []
+    before = time.perf_counter()
+    with journal.open(mode='a', newline='') as f, ProcessPoolExecutor(max_workers=workers) as executor:
+        writer = csv.DictWriter(f, fieldnames=COLUMNS)
+        if f.tell() == 0:
+            writer.writeheader()
+        futures = {executor.submit(analyse_file, p, gamma, bits, metric, scale): p for p in todo}
+        for i, future in enumerate(as_completed(futures), start=1):
+            path = futures[future]
+            try:
+                row = future.result()
+                writer.writerow(row)
+                f.flush()
+                print(f'[{i}/{len(todo)}] {path} in {row["elapsed"]:.3f}s')
+            except Exception as e:
+                failed.append(path)
+                print(f'[{i}/{len(todo)}] {path} FAILED {e}')
+    print(f'Analysed {len(todo) - len(failed)} files in {time.perf_counter() - before:.3f}s, {len(failed)} failed')
+    for path in failed:
+        print(f'Failed: {path}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='batch', description='Calculates light levels of many images or videos')
+    parser.add_argument('paths', nargs='+', help='Files, directories or globs to analyse')
+    parser.add_argument('-o', '--output', help='csv or parquet file to write, rerun to resume', required=True)
+    parser.add_argument('-w', '--workers', help='No of files to analyse concurrently', default=os.cpu_count(),
+                        type=int)
+    parser.add_argument('-g', '--gamma', help='Gamma to decode images with, omit if PQ encoded', type=float)
+    parser.add_argument('-b', '--bits', help='Histogram resolution in bits', default=10, type=int)
+    parser.add_argument('-m', '--metric', help='Per pixel light level for videos', choices=['maxrgb', 'luma'],
+                        default='maxrgb')
+    parser.add_argument('-s', '--scale', help='Downsample factor for videos', default=1, type=int)
+    args = parser.parse_args()
+
+    output = Path(args.output)
+    parquet = output.suffix == '.parquet'
+    if parquet and importlib.util.find_spec('pyarrow') is None:
+        raise SystemExit('pyarrow is required to write parquet')
+    # rows are always streamed to csv so a batch can be resumed, parquet is written once the batch is complete
+    journal = output.with_suffix('.partial.csv') if parquet else output
+    run(find_files(args.paths), journal, args.workers, args.gamma, args.bits, args.metric, args.scale)
+    if parquet and journal.exists():
+        pd.read_csv(journal).to_parquet(output, index=False)
+        print(f'Wrote {output}')
@@ -1,63 +1,67 @@
 from pathlib import Path
+from typing import Optional, Tuple
 
 import numpy as np
 import pandas as pd
 from PIL import Image
-from colour.models import eotf_ST2084, eotf_inverse_ST2084
-
-files = [
-    # (None, '/home/matt/dev/github/3ll3d00d/jrmc-utils/greyscale/greyscale_100_1000.png', 10000),
-    # (2.2, '/media/home-media/docs/calibration/tonemapping/greyscale/greyscale_jrvr_spline0.5_peak1000_3dlut_none.png', 1000),
-    # (2.2, '/home/matt/Pictures/orient_express.png', 1000),
-    (2.2, '/home/matt/Pictures/orient_express_full.png', 1000),
-    # (2.2, '/media/home-media/showhorses.png', 1000),
-    # (None, '/media/home-media/showhorses.png', 1000),
-    # (2.2, '/home/matt/Downloads/adl5.png')
-]
-data = []
-for gamma, f, max_cll in files:
+from colour.models import eotf_ST2084
+
+from histogram import PQHistogram
+from luts import gamma_lut
+
+# histogram resolution
+BITS = 10
+
+COLUMNS = ['Name', 'max(RGB)', 'APL %', 'FALL', 'EST FALL', 'FALL ERR', 'PQ FALL', 'EST PQ FALL', 'P99.95', 'EST P99.95',
+           'P99.95 ERR', 'PQ P99.95', 'MAX']
+
+
+def load_luminance(f: str, gamma: Optional[float]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    :param f: the image.
+    :param gamma: the gamma to decode the image with, None if the image is already PQ encoded.
+    :return: the image and the luminance of every non black pixel.
+    """
     im = np.array(Image.open(f).convert('RGB'))
-    rgb = (im / 255)
-    linear_rgb = rgb ** gamma if gamma else rgb
+    linear_rgb = gamma_lut(gamma, 8)[im] if gamma else im / 255
     luminance = np.dot(linear_rgb[..., :3], [0.2126, 0.7152, 0.0722])
-    luminance = luminance[luminance > 0]
+    return im, luminance[luminance > 0]
+
+
+def analyse(gamma: Optional[float], f: str) -> list:
+    im, luminance = load_luminance(f, gamma)
     nits_luminance = eotf_ST2084(luminance)
 
     apl = np.mean(luminance) * 100
 
     fall = np.mean(nits_luminance)
     pq_fall = eotf_ST2084(np.mean(luminance))
+    pq_p9995 = eotf_ST2084(np.percentile(luminance, 99.95))
 
     p9995 = np.percentile(nits_luminance, 99.95)
 
-    def estimate_percentile(histo, lim):
-        histo_lim = int(luminance.size * (lim / 100))
-        histo_cumsum = np.cumsum(histo[0])
-        pos = np.argmax(histo_cumsum >= histo_lim)
-        lower_bound, upper_bound = histo[1][pos:pos+2]
-        bin_size = histo[0][pos]
-        bin_width = upper_bound - lower_bound
-        bin_pos = (histo_cumsum[pos] - histo_lim) / bin_size
-        return bin_width * bin_pos + lower_bound
-
-    def estimate_mean(histo):
-        midpoints = (histo[1] + (histo[1][1] - histo[1][0])/2)[:-1]
-        fx = histo[0] * midpoints
-        return np.sum(fx) / np.sum(histo[0])
-
-
-    nits_histo = np.histogram(nits_luminance, bins=64)
-    estimated_p9995 = estimate_percentile(nits_histo, 99.95)
-    est_fall = estimate_mean(nits_histo)
-
-    pq_p9995 = eotf_ST2084(np.percentile(luminance, 99.95))
-    pq_histo = np.histogram(luminance, bins=64)
-    estimated_pq_p9995 = eotf_ST2084(estimate_percentile(pq_histo, 99.95))
-    est_pq_fall = eotf_ST2084(estimate_mean(pq_histo))
+    # estimates from the histogram alone alongside the measured error against the exact values
+    histo = PQHistogram(BITS).add_signal(luminance)
+    est_fall = histo.mean()
+    fall_err = abs(est_fall - fall)
+    est_pq_fall = eotf_ST2084(histo.mean_signal())
+    estimated_p9995 = histo.percentile(99.95)
+    p9995_err = abs(estimated_p9995 - p9995)
 
     max_nits = np.max(nits_luminance)
     # max_xy = list(reversed(np.unravel_index(luminance.argmax(), luminance.shape)))
-    data.append([Path(f).name, np.max(im), apl, fall, est_fall, pq_fall, est_pq_fall, p9995, estimated_p9995, pq_p9995, estimated_pq_p9995, max_nits])
+    return [Path(f).name, np.max(im), apl, fall, est_fall, fall_err, pq_fall, est_pq_fall, p9995, estimated_p9995, p9995_err, pq_p9995, max_nits]
+
 
-df = pd.DataFrame(data, columns=['Name', 'max(RGB)', 'APL %', 'FALL', 'EST FALL', 'PQ FALL', 'EST PQ FALL', 'P99.95', 'EST P99.95', 'PQ P99.95', 'EST PQ P99.95', 'MAX'])
-df
\ No newline at end of file
+if __name__ == '__main__':
+    files = [
+        # (None, '/home/matt/dev/github/3ll3d00d/jrmc-utils/greyscale/greyscale_100_1000.png', 10000),
+        # (2.2, '/media/home-media/docs/calibration/tonemapping/greyscale/greyscale_jrvr_spline0.5_peak1000_3dlut_none.png', 1000),
+        # (2.2, '/home/matt/Pictures/orient_express.png', 1000),
+        (2.2, '/home/matt/Pictures/orient_express_full.png', 1000),
+        # (2.2, '/media/home-media/showhorses.png', 1000),
+        # (None, '/media/home-media/showhorses.png', 1000),
+        # (2.2, '/home/matt/Downloads/adl5.png')
+    ]
+    df = pd.DataFrame([analyse(gamma, f) for gamma, f, max_cll in files], columns=COLUMNS)
+    print(df)
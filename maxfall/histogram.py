@@ -0,0 +1,149 @@
+from functools import lru_cache
+from typing import Optional, Tuple
+
+import numpy as np
+from colour.models import eotf_ST2084
+
+from luts import eotf_lut
+
+
+@lru_cache(maxsize=None)
+def bin_edges(bits: int) -> np.ndarray:
+    """
+    :param bits: the histogram resolution.
+    :return: the luminance (nits) at the lower edge of each bin plus the upper edge of the last bin.
+    """
+    lut = eotf_lut('pq', bits)
+    return np.append(lut, lut[-1])
+
+
+class PQHistogram:
+    """
+    Pixel counts per PQ code value, the single pass reduction from which frame and title level light statistics are
+    derived. Histograms of the same resolution can be merged so frames, segments and worker processes can each be
+    reduced independently.
+    """
+
+    def __init__(self, bits: int = 10, counts: Optional[np.ndarray] = None):
+        self.__bits = bits
+        self.__counts = np.zeros(2 ** bits, dtype=np.int64) if counts is None else counts
+
+    @property
+    def bits(self) -> int:
+        return self.__bits
+
+    @property
+    def counts(self) -> np.ndarray:
+        return self.__counts
+
+    @property
+    def count(self) -> int:
+        return int(self.__counts.sum())
+
+    @property
+    def __top(self) -> int:
+        return 2 ** self.__bits - 1
+
+    def add_codes(self, codes: np.ndarray, code_bits: int = 16) -> 'PQHistogram':
+        """
+        :param codes: unsigned integer PQ code values.
+        :param code_bits: the bit depth of the codes, the low order bits are dropped if greater than the resolution.
+        :return: self.
+        """
+        shift = code_bits - self.__bits
+        if shift < 0:
+            raise ValueError(f'Codes of {code_bits} bits cannot fill a histogram of {self.__bits} bits')
+        codes = codes.ravel()
+        self.__counts += np.bincount(codes >> shift if shift else codes, minlength=2 ** self.__bits)
+        return self
+
+    def add_signal(self, signal: np.ndarray) -> 'PQHistogram':
+        """
+        :param signal: PQ encoded values in the range 0-1.
+        :return: self.
+        """
+        codes = np.clip(signal.ravel() * self.__top, 0, self.__top).astype(np.uint32)
+        self.__counts += np.bincount(codes, minlength=2 ** self.__bits)
+        return self
+
+    def merge(self, other: 'PQHistogram') -> 'PQHistogram':
+        if other.bits != self.__bits:
+            raise ValueError(f'Cannot merge a {other.bits} bit histogram into a {self.__bits} bit histogram')
+        self.__counts += other.counts
+        return self
+
+    def __iadd__(self, other: 'PQHistogram') -> 'PQHistogram':
+        return self.merge(other)
+
+    def __add__(self, other: 'PQHistogram') -> 'PQHistogram':
+        return PQHistogram(self.__bits, self.__counts.copy()).merge(other)
+
+    def mean(self) -> float:
+        """
+        :return: mean luminance in nits, exact if the pixels were quantised to the histogram resolution.
+        """
+        return float(np.dot(self.__counts, bin_edges(self.__bits)[:-1]) / self.count)
+
+    def mean_bounds(self) -> Tuple[float, float]:
+        """
+        :return: the range the true mean luminance must lie in given only the histogram.
+        """
+        edges = bin_edges(self.__bits)
+        n = self.count
+        return float(np.dot(self.__counts, edges[:-1]) / n), float(np.dot(self.__counts, edges[1:]) / n)
+
+    def mean_signal(self) -> float:
+        """
+        :return: mean PQ signal in the range 0-1.
+        """
+        return float(np.dot(self.__counts, np.arange(self.__counts.size)) / self.count / self.__top)
+
+    def __percentile_bin(self, pct: float) -> int:
+        return int(np.searchsorted(np.cumsum(self.__counts), self.count * pct / 100))
+
+    def percentile(self, pct: float) -> float:
+        """
+        :param pct: the percentile, 0-100.
+        :return: the luminance in nits at that percentile.
+        """
+        return float(bin_edges(self.__bits)[self.__percentile_bin(pct)])
+
+    def percentile_bounds(self, pct: float) -> Tuple[float, float]:
+        edges = bin_edges(self.__bits)
+        idx = self.__percentile_bin(pct)
+        return float(edges[idx]), float(edges[idx + 1])
+
+    def max(self) -> float:
+        """
+        :return: the luminance in nits of the brightest populated bin, 0 if the histogram is empty.
+        """
+        populated = np.flatnonzero(self.__counts)
+        return float(bin_edges(self.__bits)[populated[-1]]) if populated.size else 0.0
+
+    def stats(self) -> Tuple[float, float, float, float]:
+        """
+        :return: FALL, APL %, P99.95 and max, all 0 if the histogram is empty (e.g. an all black image).
+        """
+        if self.count == 0:
+            return 0.0, 0.0, 0.0, 0.0
+        return self.mean(), self.mean_signal() * 100, self.percentile(99.95), self.max()
+
+
+def measure_error(signal: np.ndarray, bits: int = 10, pct: float = 99.95) -> dict:
+    """
+    Compares statistics derived from a histogram against the exact values computed over every pixel.
+    :param signal: PQ encoded values in the range 0-1.
+    :param bits: the histogram resolution.
+    :param pct: the percentile to compare.
+    :return: the exact and estimated mean and percentile along with the bounds on each estimate.
+    """
+    histo = PQHistogram(bits).add_signal(signal)
+    nits = eotf_ST2084(signal)
+    return {
+        'mean': float(np.mean(nits)),
+        'est_mean': histo.mean(),
+        'mean_bounds': histo.mean_bounds(),
+        'percentile': float(np.percentile(nits, pct)),
+        'est_percentile': histo.percentile(pct),
+        'percentile_bounds': histo.percentile_bounds(pct)
+    }
@@ -0,0 +1,120 @@
+import argparse
+import json
+import shlex
+import subprocess
+import time
+from concurrent.futures import ProcessPoolExecutor
+from fractions import Fraction
+from typing import Tuple, Optional
+
+import numpy as np
+import pandas as pd
+
+from histogram import PQHistogram
+
+FRAME_COLUMNS = ['frame', 'ts', 'FALL', 'APL %', 'P99.95', 'MAX']
+
+
+def probe(path: str) -> Tuple[int, int, float, float]:
+    """
+    :param path: the video.
+    :return: width, height, frame rate and duration (in seconds).
+    """
+    cmd = f'ffprobe -v error -select_streams v:0 -show_entries stream=width,height,r_frame_rate:format=duration ' \
+          f'-of json "{path}"'
+    info = json.loads(subprocess.check_output(shlex.split(cmd)))
+    stream = info['streams'][0]
+    return int(stream['width']), int(stream['height']), float(Fraction(stream['r_frame_rate'])), \
+        float(info['format']['duration'])
+
+
+def analyse_segment(path: str, start: float, length: Optional[float], w: int, h: int, fps: float, bits: int = 10,
+                    metric: str = 'maxrgb', scale: int = 1) -> Tuple[np.ndarray, PQHistogram]:
+    """
+    Decodes a segment of a PQ video to 16 bit rawvideo and reduces each frame to a histogram of PQ code values.
+    :param path: the video.
+    :param start: the segment start in seconds.
+    :param length: the segment length in seconds, None to read to the end.
+    :param w: the frame width.
+    :param h: the frame height.
+    :param fps: the frame rate.
+    :param bits: the histogram resolution.
+    :param metric: maxrgb (per CTA-861.3) or luma (the Y' plane, a third of the data to move).
+    :param scale: downsample factor applied by ffmpeg before the frames are read.
+    :return: per frame stats (frames x FRAME_COLUMNS) and the histogram over all frames in the segment.
+    """
+    w = w // scale
+    h = h // scale
+    planes = 3 if metric == 'maxrgb' else 1
+    pix_fmt = 'gbrp16le' if metric == 'maxrgb' else 'gray16le'
+    vf = f'scale={w}:{h}:in_color_matrix=bt2020:flags=area' if scale > 1 else 'scale=in_color_matrix=bt2020'
+    duration = f'-t {length} ' if length else ''
+    cmd = f'ffmpeg -v error -ss {start} {duration}-i "{path}" -vf {vf} -pix_fmt {pix_fmt} -f rawvideo -'
+    frame_bytes = w * h * planes * 2
+    total = PQHistogram(bits)
+    rows = []
+    with subprocess.Popen(shlex.split(cmd), stdout=subprocess.PIPE, stderr=subprocess.DEVNULL) as proc:
+        buf = bytearray(frame_bytes)
+        while proc.stdout.readinto(buf) == frame_bytes:
+            frame = np.frombuffer(buf, dtype='<u2').reshape(planes, h * w)
+            codes = frame.max(axis=0) if planes > 1 else frame[0]
+            histo = PQHistogram(bits).add_codes(codes)
+            total += histo
+            idx = len(rows)
+            rows.append((idx, start + idx / fps) + histo.stats())
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, cmd)
+    return np.array(rows, dtype=np.float64).reshape(-1, len(FRAME_COLUMNS)), total
+
+
+def analyse(path: str, jobs: int = 1, bits: int = 10, metric: str = 'maxrgb',
+            scale: int = 1) -> Tuple[pd.DataFrame, dict]:
+    """
+    Analyses a whole video, split into jobs segments which are decoded and analysed concurrently.
+    :return: per frame stats and the title level summary.
+    """
+    w, h, fps, duration = probe(path)
+    seg_len = duration / jobs
+    starts = [i * seg_len for i in range(jobs)]
+    lengths = [seg_len] * (jobs - 1) + [None]
+    before = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        segments = list(executor.map(analyse_segment, [path] * jobs, starts, lengths, [w] * jobs, [h] * jobs,
+                                     [fps] * jobs, [bits] * jobs, [metric] * jobs, [scale] * jobs))
+    elapsed = time.perf_counter() - before
+    frames = pd.DataFrame(np.concatenate([s[0] for s in segments]), columns=FRAME_COLUMNS)
+    frames['frame'] = np.arange(len(frames))
+    total = PQHistogram(bits)
+    for _, histo in segments:
+        total += histo
+    fall, apl, p9995, max_nits = total.stats()
+    summary = {
+        'Name': path,
+        'frames': len(frames),
+        'MaxFALL': frames['FALL'].max(),
+        'MaxCLL': frames['MAX'].max(),
+        'FALL': fall,
+        'APL %': apl,
+        'P99.95': p9995,
+        'MAX': max_nits,
+        'elapsed': elapsed,
+        'speed': (len(frames) / fps) / elapsed if elapsed else 0.0
+    }
+    return frames, summary
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='stream', description='Calculates MaxFALL/MaxCLL of a PQ encoded video')
+    parser.add_argument('path', help='The video')
+    parser.add_argument('-j', '--jobs', help='No of segments to analyse concurrently', default=1, type=int)
+    parser.add_argument('-b', '--bits', help='Histogram resolution in bits', default=10, type=int)
+    parser.add_argument('-m', '--metric', help='Per pixel light level', choices=['maxrgb', 'luma'], default='maxrgb')
+    parser.add_argument('-s', '--scale', help='Downsample factor', default=1, type=int)
+    parser.add_argument('-o', '--output', help='Write per frame stats to this csv file')
+    args = parser.parse_args()
+
+    frames, summary = analyse(args.path, jobs=args.jobs, bits=args.bits, metric=args.metric, scale=args.scale)
+    if args.output:
+        frames.to_csv(args.output, index=False)
+    for k, v in summary.items():
+        print(f'{k}: {v:.6g}' if isinstance(v, float) else f'{k}: {v}')
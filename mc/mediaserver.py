@@ -1,19 +1,168 @@
+import asyncio
 import sys
+import threading
 import urllib
-from typing import Optional, Tuple, List, Union
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple, List, Union, Dict, Iterable, Set
 from xml.etree import ElementTree as et
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DEFAULT_TIMEOUT = (1, 5)
+# a full library search can take a lot longer than a simple command to complete
+DEFAULT_TIMEOUTS = {'Files/Search': (1, 60)}
+RETRY_STATUSES = (500, 502, 503, 504)
+NAME_FIELDS = 'Filename,Name,Key,Borrowed'
+
+
+class _CountingRetry(Retry):
+    """ A Retry which records each retry attempt against the owning Transport. """
+
+    def __init__(self, *args, on_retry: Optional[callable] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.on_retry = on_retry
+
+    def new(self, **kw):
+        retry = super().new(**kw)
+        retry.on_retry = self.on_retry
+        return retry
+
+    def increment(self, *args, **kwargs):
+        if self.on_retry:
+            self.on_retry('retries')
+        return super().increment(*args, **kwargs)
+
+
+class Transport:
+    """
+    Keep-alive connection pool to a single MCWS instance with retry/backoff on transient failures and per endpoint
+    timeouts. Counts every round trip so callers can see how chatty a script is.
+    """
+
+    def __init__(self, base_url: str, auth: Optional[Tuple[str, str]] = None, pool_size: int = 4, retries: int = 3,
+                 backoff: float = 0.5, timeout: Tuple[float, float] = DEFAULT_TIMEOUT,
+                 timeouts: Optional[Dict[str, Tuple[float, float]]] = None):
+        self.__base_url = base_url
+        self.__auth = auth
+        self.__pool_size = pool_size
+        self.__retries = retries
+        self.__backoff = backoff
+        self.__timeout = timeout
+        self.__timeouts = {**DEFAULT_TIMEOUTS, **(timeouts if timeouts else {})}
+        self.__session: Optional[requests.Session] = None
+        self.__lock = threading.Lock()
+        self.__stats = Counter()
+
+    @property
+    def pool_size(self) -> int:
+        return self.__pool_size
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        with self.__lock:
+            return dict(self.__stats)
+
+    def count(self, name: str):
+        with self.__lock:
+            self.__stats[name] += 1
+
+    def reset_stats(self):
+        with self.__lock:
+            self.__stats.clear()
+
+    def timeout(self, endpoint: str) -> Tuple[float, float]:
+        return self.__timeouts.get(endpoint, self.__timeout)
+
+    def __create_session(self) -> requests.Session:
+        session = requests.Session()
+        session.auth = self.__auth
+        retry = _CountingRetry(total=self.__retries,
+                               backoff_factor=self.__backoff,
+                               status_forcelist=RETRY_STATUSES,
+                               allowed_methods=frozenset(['GET']),
+                               raise_on_status=False,
+                               on_retry=self.count)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.__pool_size, max_retries=retry, pool_block=True)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    @property
+    def session(self) -> requests.Session:
+        if self.__session is None:
+            with self.__lock:
+                if self.__session is None:
+                    self.__session = self.__create_session()
+        return self.__session
+
+    def get(self, endpoint: str, params: Optional[Union[dict, str]] = None) -> requests.Response:
+        self.count('requests')
+        self.count(endpoint)
+        return self.session.get(f"{self.__base_url}/{endpoint}", timeout=self.timeout(endpoint), params=params)
+
+    def close(self):
+        with self.__lock:
+            if self.__session is not None:
+                self.__session.close()
+                self.__session = None
+
+
+def is_ok(r: requests.Response) -> Optional[et.Element]:
+    """
+    :param r: the response.
+    :return: the parsed MCWS response if the call succeeded.
+    """
+    if r.status_code == 200:
+        response = et.fromstring(r.content)
+        if response is not None and response.attrib.get('Status', None) == 'OK':
+            return response
+    return None
+
+
+def _name_query(film_name: str, exact: bool) -> str:
+    return f'[Name]=[{film_name}]' if exact else f'[Name]={film_name}'
+
+
+def _needs_exact_search(film_name: str, results: Optional[list]) -> bool:
+    """
+    :return: true if a partial name search was ambiguous, i.e. it found several candidates or, for a multi word name,
+    none at all, so the exact name should be tried.
+    """
+    return len(results) > 1 if results else ' ' in film_name
+
+
+def _select_by_name(film_name: str, exact: bool, results: Optional[list],
+                    exact_results: Optional[list]) -> Optional[dict]:
+    """
+    Shared by MediaServer and AsyncMediaServer so the two cannot pick different titles.
+    :param film_name: the name searched for.
+    :param exact: whether results came from an exact name search.
+    :param results: the results of the name search.
+    :param exact_results: the results of the exact name search, if one was required.
+    :return: the single matching title, if any.
+    """
+    if results and (exact or len(results) == 1):
+        return results[0]
+    if exact_results:
+        return exact_results[0]
+    if not exact:
+        print(f"NO MATCH for \"{film_name}\", {len(results) if results else 0} candidates", file=sys.stderr)
+    return None
 
 
 class MediaServer:
 
-    def __init__(self, ip: str, auth: Optional[Tuple[str, str]] = None, secure: bool = False):
+    def __init__(self, ip: str, auth: Optional[Tuple[str, str]] = None, secure: bool = False, pool_size: int = 4,
+                 retries: int = 3, backoff: float = 0.5, timeouts: Optional[Dict[str, Tuple[float, float]]] = None):
         self.__ip = ip
         self.__auth = auth
         self.__secure = secure
         self.__base_url = f"http{'s' if secure else ''}://{ip}/MCWS/v1"
-        self.__session = None
+        self.__transport = Transport(self.__base_url, auth=auth, pool_size=pool_size, retries=retries,
+                                     backoff=backoff, timeouts=timeouts)
         self.__token = None
 
     def as_dict(self) -> dict:
@@ -23,20 +172,22 @@ class MediaServer:
         suffix = f" [{self.__auth[0]}]" if self.__auth else ' [Unauthenticated]'
         return f"{self.__ip}{suffix}"
 
+    @property
+    def transport(self) -> Transport:
+        return self.__transport
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return self.__transport.stats
+
     def authenticate(self) -> bool:
         self.__token = None
-        url = f"{self.__base_url}/Authenticate"
-        self.__session = requests.Session()
-        self.__session.auth = self.__auth
-        r = self.__session.get(url, timeout=(1, 5))
-        if r.status_code == 200:
-            response = et.fromstring(r.content)
-            if response:
-                r_status = response.attrib.get('Status', None)
-                if r_status == 'OK':
-                    for item in response:
-                        if item.attrib['Name'] == 'Token':
-                            self.__token = item.text
+        r = self.__transport.get('Authenticate')
+        response = is_ok(r)
+        if response is not None:
+            for item in response:
+                if item.attrib['Name'] == 'Token':
+                    self.__token = item.text
         if self.connected:
             return True
         else:
@@ -50,34 +201,33 @@ class MediaServer:
         if not self.connected:
             self.authenticate()
 
-    def search_by_name(self, film_name: str, exact: bool = False) -> dict:
-        match = None
-        if exact:
-            film_name = f"[{film_name}]"
-        results = self.search(f'[Name]={film_name}', 'Filename,Name,Key,Borrowed')
-        if len(results) > 1:
-            if not exact:
-                match = self.search(f'[Name]=[{film_name}]', 'Filename,Name,Key,Borrowed')
-                if not match:
-                    print(f"NO MATCH for \"{film_name}\", {len(results)} candidates", file=sys.stderr)
-            else:
-                match = results[0]
-        elif not exact:
-            if ' ' in film_name:
-                self.search_by_name(film_name, exact=True)
-            else:
-                print(f"NO MATCH for \"{film_name}\", 0 candidates", file=sys.stderr)
-        return match
+    def __get(self, endpoint: str, params: Optional[Union[dict, str]] = None) -> requests.Response:
+        self.__auth_if_required()
+        r = self.__transport.get(endpoint, params=params)
+        if r.status_code == 401:
+            # token has expired so login again and replay the request
+            self.__transport.count('reauthentications')
+            self.authenticate()
+            r = self.__transport.get(endpoint, params=params)
+        return r
+
+    def search_by_name(self, film_name: str, exact: bool = False) -> Optional[dict]:
+        results = self.search(_name_query(film_name, exact), NAME_FIELDS)
+        exact_results = None
+        if not exact and _needs_exact_search(film_name, results):
+            exact_results = self.search(_name_query(film_name, True), NAME_FIELDS)
+        return _select_by_name(film_name, exact, results, exact_results)
 
     def search(self, src_query: str, fields: str) -> Optional[Union[dict, list]]:
-        self.__auth_if_required()
-        url = f"{self.__base_url}/Files/Search"
+        return self.__search(f'{src_query} [Media Type]=Video [Media Sub Type]=Movie', fields)
+
+    def __search(self, query: str, fields: str) -> Optional[Union[dict, list]]:
         params = urllib.parse.urlencode({
             'Action': 'json',
             'Fields': fields,
-            'Query': f'{src_query} [Media Type]=Video [Media Sub Type]=Movie'
+            'Query': query
         }, quote_via=urllib.parse.quote)
-        r = self.__session.get(url, auth=self.__auth, timeout=(1, 5), params=params)
+        r = self.__get('Files/Search', params=params)
         if r.status_code == 200:
             return r.json()
         else:
@@ -85,39 +235,144 @@ class MediaServer:
             return None
 
     def set_value(self, key: str, field: str, value: str):
+        r = self.__get('File/SetInfo', params={'File': key, 'FileType': 'Key', 'Field': field, 'Value': value})
+        return is_ok(r) is not None
+
+    def set_values(self, updates: Iterable[Tuple[str, str, str]], keys_per_call: int = 50,
+                   dry_run: bool = False) -> Dict[Tuple[str, str], Optional[bool]]:
+        """
+        Sets many values at once, updates which set the same field to the same value are sent as a single call with a
+        comma delimited list of keys and the resulting calls are issued concurrently over the connection pool. A multi
+        key call is confirmed by searching for the keys it covered, any key which does not hold the new value is then
+        set individually so a server which does not accept a list of keys still gets every update.
+        :param updates: (key, field, value) tuples, if a key and field is repeated then the last value wins.
+        :param keys_per_call: the max no of keys to send in one call, 1 disables grouping.
+        :param dry_run: if true, log the calls that would be made without sending them.
+        :return: success by (key, field), None if dry_run.
+        """
+        latest = {(str(key), field): value for key, field, value in updates}
+        by_field_value = defaultdict(list)
+        for (key, field), value in latest.items():
+            by_field_value[(field, value)].append(key)
+        calls = [(keys[i:i + keys_per_call], field, value)
+                 for (field, value), keys in by_field_value.items()
+                 for i in range(0, len(keys), keys_per_call)]
+        if dry_run:
+            for keys, field, value in calls:
+                print(f"DRY RUN: {field}={value} for {','.join(keys)}")
+            return {k: None for k in latest.keys()}
+
+        def set_all(keys: List[str], field: str, value: str) -> Dict[Tuple[str, str], bool]:
+            if len(keys) == 1:
+                return {(keys[0], field): self.set_value(keys[0], field, value)}
+            # Status=OK only says the call was accepted so read back which keys actually took the value
+            applied = self.__has_value(keys, field, value) if self.set_value(','.join(keys), field, value) else set()
+            return {(k, field): True if k in applied else self.set_value(k, field, value) for k in keys}
+
         self.__auth_if_required()
-        url = f"{self.__base_url}/File/SetInfo"
-        r = self.__session.get(url, auth=self.__auth, timeout=(1, 5), params={'File': key, 'FileType': 'Key', 'Field': field, 'Value': value})
-        if r.status_code == 200:
-            response = et.fromstring(r.content)
-            if response is not None:
-                r_status = response.attrib.get('Status', None)
-                if r_status == 'OK':
-                    return True
-        return False
+        results = {}
+        with ThreadPoolExecutor(max_workers=self.__transport.pool_size) as executor:
+            for result in executor.map(lambda c: set_all(*c), calls):
+                results.update(result)
+        return results
+
+    def __has_value(self, keys: List[str], field: str, value: str) -> Set[str]:
+        """
+        :return: the keys which currently hold value in field.
+        """
+        # set_values is not limited to movies so neither is the read back
+        results = self.__search(f"[Key]={','.join(f'[{k}]' for k in keys)}", f'Key,{field}')
+        if not results:
+            return set()
+        return {str(r['Key']) for r in results if str(r.get(field, '')) == str(value)}
 
     def set_position(self, position: int):
-        self.__auth_if_required()
-        url = f"{self.__base_url}/Playback/Position"
-        r = self.__session.get(url, auth=self.__auth, timeout=(1, 5), params={'Position': position})
-        if r.status_code == 200:
-            response = et.fromstring(r.content)
-            if response is not None:
-                r_status = response.attrib.get('Status', None)
-                if r_status == 'OK':
-                    return True
-        return False
+        r = self.__get('Playback/Position', params={'Position': position})
+        return is_ok(r) is not None
 
     def get_position(self) -> int:
-        self.__auth_if_required()
-        url = f"{self.__base_url}/Playback/Position"
-        r = self.__session.get(url, auth=self.__auth, timeout=(1, 5))
-        if r.status_code == 200:
-            response = et.fromstring(r.content)
-            if response is not None:
-                r_status = response.attrib.get('Status', None)
-                if r_status == 'OK':
-                    for child in response:
-                        if child.tag == 'Item' and child.attrib.get('Name', '') == 'Position':
-                            return int(child.text)
+        response = is_ok(self.__get('Playback/Position'))
+        if response is not None:
+            for child in response:
+                if child.tag == 'Item' and child.attrib.get('Name', '') == 'Position':
+                    return int(child.text)
         return -1
+
+
+class AsyncMediaServer:
+    """
+    asyncio facade over MediaServer, calls are dispatched to a thread pool sized to match the connection pool so at
+    most concurrency requests are in flight against the server at any one time.
+    """
+
+    def __init__(self, ip: str, auth: Optional[Tuple[str, str]] = None, secure: bool = False, concurrency: int = 16,
+                 retries: int = 3, backoff: float = 0.5, timeouts: Optional[Dict[str, Tuple[float, float]]] = None):
+        self.__delegate = MediaServer(ip, auth=auth, secure=secure, pool_size=concurrency, retries=retries,
+                                      backoff=backoff, timeouts=timeouts)
+        self.__concurrency = concurrency
+        self.__executor: Optional[ThreadPoolExecutor] = None
+        self.__semaphore: Optional[asyncio.Semaphore] = None
+        self.__auth_lock: Optional[asyncio.Lock] = None
+
+    def __repr__(self):
+        return repr(self.__delegate)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        if self.__executor is not None:
+            self.__executor.shutdown(wait=False)
+            self.__executor = None
+        self.__delegate.transport.close()
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return self.__delegate.stats
+
+    @property
+    def connected(self) -> bool:
+        return self.__delegate.connected
+
+    async def __call(self, func: callable, *args):
+        if self.__executor is None:
+            self.__executor = ThreadPoolExecutor(max_workers=self.__concurrency, thread_name_prefix='mcws')
+            self.__semaphore = asyncio.Semaphore(self.__concurrency)
+            self.__auth_lock = asyncio.Lock()
+        if not self.__delegate.connected:
+            # authenticate once rather than have every pending call race to do so
+            async with self.__auth_lock:
+                if not self.__delegate.connected:
+                    await asyncio.get_running_loop().run_in_executor(self.__executor, self.__delegate.authenticate)
+        async with self.__semaphore:
+            return await asyncio.get_running_loop().run_in_executor(self.__executor, func, *args)
+
+    async def authenticate(self) -> bool:
+        return await self.__call(self.__delegate.authenticate)
+
+    async def search_by_name(self, film_name: str, exact: bool = False) -> Optional[dict]:
+        results = await self.search(_name_query(film_name, exact), NAME_FIELDS)
+        exact_results = None
+        if not exact and _needs_exact_search(film_name, results):
+            exact_results = await self.search(_name_query(film_name, True), NAME_FIELDS)
+        return _select_by_name(film_name, exact, results, exact_results)
+
+    async def search(self, src_query: str, fields: str) -> Optional[Union[dict, list]]:
+        return await self.__call(self.__delegate.search, src_query, fields)
+
+    async def set_value(self, key: str, field: str, value: str) -> bool:
+        return await self.__call(self.__delegate.set_value, key, field, value)
+
+    async def set_values(self, updates: Iterable[Tuple[str, str, str]], keys_per_call: int = 50,
+                         dry_run: bool = False) -> Dict[Tuple[str, str], Optional[bool]]:
+        # set_values pipelines over its own pool so only occupy a single slot here
+        return await self.__call(self.__delegate.set_values, list(updates), keys_per_call, dry_run)
+
+    async def set_position(self, position: int) -> bool:
+        return await self.__call(self.__delegate.set_position, position)
+
+    async def get_position(self) -> int:
+        return await self.__call(self.__delegate.get_position)
@@ -1,8 +1,11 @@
+import argparse
+import asyncio
 import csv
 import re
 import sys
+from typing import Optional
 
-from mediaserver import MediaServer
+from mediaserver import AsyncMediaServer
 
 # logging.basicConfig()
 # logging.getLogger().setLevel(logging.DEBUG)
@@ -10,21 +13,46 @@ from mediaserver import MediaServer
 # requests_log.setLevel(logging.DEBUG)
 # requests_log.propagate = True
 
-if __name__ == '__main__':
-    input_file = sys.argv[1]
-    mc = MediaServer(sys.argv[2], (sys.argv[3], sys.argv[4]))
+
+def read_names(input_file: str) -> list:
+    names = []
     with open(input_file, "r", encoding="utf8") as cinema_paradiso:
         reader = csv.DictReader(cinema_paradiso, delimiter="\t")
         for line in reader:
-            year = line["YEAR"]
             name = line["FILM"].strip()
             m = re.search(r'(.*)( \(BLU-RAY.*\))', name)
             if m:
                 name = m.group(1)
-            match = mc.search(name)
-            if match:
-                is_borrowed = match.get('Borrowed', 0)
-                print(f"FOUND,{match['Key']},\"{match['Filename']}\",\"{name}\",{is_borrowed}")
-                if not is_borrowed:
-                    if not mc.set_value(match['Key'], 'Borrowed', '1'):
-                        print(f"***FAILED TO SET VALUE***", file=sys.stderr)
+            names.append(name)
+    return names
+
+
+async def find_unborrowed(mc: AsyncMediaServer, name: str) -> Optional[str]:
+    match = await mc.search_by_name(name)
+    if match:
+        is_borrowed = match.get('Borrowed', 0)
+        print(f"FOUND,{match['Key']},\"{match['Filename']}\",\"{name}\",{is_borrowed}")
+        if not is_borrowed:
+            return match['Key']
+    return None
+
+
+async def main(input_file: str, mc: AsyncMediaServer, dry_run: bool):
+    async with mc:
+        keys = await asyncio.gather(*[find_unborrowed(mc, name) for name in read_names(input_file)])
+        results = await mc.set_values([(k, 'Borrowed', '1') for k in keys if k], dry_run=dry_run)
+        for (key, _), ok in results.items():
+            if ok is False:
+                print(f"***FAILED TO SET VALUE*** {key}", file=sys.stderr)
+        print(f"MCWS calls: {mc.stats}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='set_item', description='Marks films listed in a rental history as Borrowed')
+    parser.add_argument('input_file', help='Tab separated rental history with FILM and YEAR columns')
+    parser.add_argument('ip', help='MCWS host:port')
+    parser.add_argument('user')
+    parser.add_argument('password')
+    parser.add_argument('-n', '--dry-run', help='Show the updates without making them', action='store_true')
+    args = parser.parse_args()
+    asyncio.run(main(args.input_file, AsyncMediaServer(args.ip, (args.user, args.password)), args.dry_run))
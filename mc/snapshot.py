@@ -0,0 +1,133 @@
+import hashlib
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Optional, List, Dict, Tuple
+
+import requests
+
+from mediaserver import MediaServer
+
+REQUIRED_FIELDS = ['Key']
+
+
+class LibrarySnapshot:
+    """
+    Persistent copy of the results of a single MCWS search, refetched once older than the ttl, with in memory indexes
+    over the commonly joined fields.
+    """
+
+    def __init__(self, mc: MediaServer, query: str, fields: str, cache_dir: Path, ttl_seconds: float = 12 * 60 * 60):
+        self.__mc = mc
+        self.__query = query
+        self.__fields = ','.join(fields.split(',') + [f for f in REQUIRED_FIELDS if f not in fields.split(',')])
+        self.__ttl = ttl_seconds
+        digest = hashlib.sha1(f'{self.__query}|{self.__fields}'.encode('utf-8')).hexdigest()[:16]
+        self.__file = cache_dir / f'mcws_{digest}.json'
+        self.__fetched_at = 0.0
+        self.__items: List[dict] = []
+        self.__by_key: Dict[str, dict] = {}
+        self.__by_name: Dict[str, List[dict]] = {}
+        self.__by_name_dimensions: Dict[Tuple[str, str], List[dict]] = {}
+        self.__by_imdb: Dict[str, List[dict]] = {}
+
+    @property
+    def file(self) -> Path:
+        return self.__file
+
+    @property
+    def items(self) -> List[dict]:
+        return self.__items
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.__fetched_at
+
+    def load(self, force: bool = False) -> List[dict]:
+        """
+        Loads the snapshot from disk, refreshing from the server if it is missing, expired or force is set.
+        :param force: if true, fetch the whole library regardless of the state of the cache.
+        :return: the items.
+        """
+        cached = None if force else self.__read()
+        if cached is None:
+            self.__full_fetch()
+        else:
+            self.__fetched_at = cached['fetched_at']
+            self.__set_items(cached['items'])
+            if self.age > self.__ttl:
+                self.refresh()
+        return self.__items
+
+    def refresh(self):
+        """
+        Refetches the whole query, keeping the current snapshot if the server cannot be reached. Date Modified tracks
+        the file rather than the library tags so it cannot be used to pick out the items which changed.
+        """
+        try:
+            self.__full_fetch()
+        except (ValueError, requests.RequestException):
+            print(f'Unable to refresh {self.__file}, using stale snapshot', file=sys.stderr)
+
+    def __full_fetch(self):
+        started_at = time.time()
+        items = self.__mc.search(self.__query, self.__fields)
+        if items is None:
+            raise ValueError(f'Unable to fetch {self.__query}')
+        self.__fetched_at = started_at
+        self.__set_items(items)
+        self.__write()
+
+    def __read(self) -> Optional[dict]:
+        if self.__file.exists():
+            try:
+                with self.__file.open(mode='r', encoding='utf-8') as f:
+                    cached = json.load(f)
+                if cached.get('query', None) == self.__query and cached.get('fields', None) == self.__fields:
+                    return cached
+            except ValueError:
+                print(f'Ignoring corrupt snapshot {self.__file}', file=sys.stderr)
+        return None
+
+    def __write(self):
+        self.__file.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.__file.with_suffix('.tmp')
+        with tmp.open(mode='w', encoding='utf-8') as f:
+            json.dump({
+                'query': self.__query,
+                'fields': self.__fields,
+                'fetched_at': self.__fetched_at,
+                'items': self.__items
+            }, f)
+        os.replace(tmp, self.__file)
+
+    def __set_items(self, items: List[dict]):
+        self.__items = items
+        by_name = defaultdict(list)
+        by_name_dimensions = defaultdict(list)
+        by_imdb = defaultdict(list)
+        for item in items:
+            name = item.get('Name', '')
+            by_name[name].append(item)
+            by_name_dimensions[(name, item.get('Dimensions', ''))].append(item)
+            if 'IMDb ID' in item:
+                by_imdb[item['IMDb ID']].append(item)
+        self.__by_key = {str(item['Key']): item for item in items}
+        self.__by_name = dict(by_name)
+        self.__by_name_dimensions = dict(by_name_dimensions)
+        self.__by_imdb = dict(by_imdb)
+
+    def by_key(self, key: str) -> Optional[dict]:
+        return self.__by_key.get(str(key), None)
+
+    def by_name(self, name: str) -> List[dict]:
+        return self.__by_name.get(name, [])
+
+    def by_name_dimensions(self, name: str, dimensions: str) -> List[dict]:
+        return self.__by_name_dimensions.get((name, dimensions), [])
+
+    def by_imdb(self, imdb_id: str) -> List[dict]:
+        return self.__by_imdb.get(imdb_id, [])
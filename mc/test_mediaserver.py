@@ -0,0 +1,155 @@
+import asyncio
+import json
+import re
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+from urllib.parse import parse_qs, urlparse
+
+from mediaserver import AsyncMediaServer, MediaServer
+
+LIBRARY = [
+    {'Key': 1, 'Name': 'Alien', 'Filename': '/films/Alien.mkv', 'Borrowed': 0},
+    {'Key': 2, 'Name': 'Aliens', 'Filename': '/films/Aliens.mkv', 'Borrowed': 0},
+    {'Key': 3, 'Name': 'Brazil', 'Filename': '/films/Brazil.mkv', 'Borrowed': 1},
+    {'Key': 4, 'Name': 'The Third Man', 'Filename': '/films/The Third Man.mkv', 'Borrowed': 0},
+    {'Key': 5, 'Name': 'Cosmos', 'Filename': '/tv/Cosmos.mkv', 'Borrowed': 0, 'Media Sub Type': 'TV Show'},
+]
+# the filter MediaServer.search appends to every query
+MOVIE_FILTER = ' [Media Type]=Video [Media Sub Type]=Movie'
+
+
+class StandInMCWS(BaseHTTPRequestHandler):
+    """
+    Just enough of MCWS to exercise MediaServer, [Name]=x is a case insensitive substring match, [Name]=[x] and
+    [Key]=[1],[2] are exact matches, MOVIE_FILTER excludes items with another Media Sub Type.
+    """
+    library: List[dict] = []
+    calls: List[Dict[str, str]] = []
+    # mimic a server which accepts a list of keys but only applies the update to the first
+    first_key_only = False
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def __reply(self, body: bytes, content_type: str):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def __ok(self, items: str = ''):
+        self.__reply(f'<Response Status="OK">{items}</Response>'.encode('utf-8'), 'text/xml')
+
+    def __search(self, query: str, fields: str) -> List[dict]:
+        library = self.library
+        if MOVIE_FILTER in query:
+            query = query.replace(MOVIE_FILTER, '')
+            library = [i for i in library if i.get('Media Sub Type', 'Movie') == 'Movie']
+        field, value = re.match(r'\[(\w+)]=(.*)', query).groups()
+        exact = re.findall(r'\[([^]]*)]', value)
+        if exact:
+            matches = [i for i in library if str(i[field]) in exact]
+        else:
+            matches = [i for i in library if value.lower() in str(i[field]).lower()]
+        return [{f: i[f] for f in fields.split(',') if f in i} for i in matches]
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        endpoint = url.path.replace('/MCWS/v1/', '')
+        self.calls.append({'endpoint': endpoint, **params})
+        if endpoint == 'Authenticate':
+            self.__ok('<Item Name="Token">abc</Item>')
+        elif endpoint == 'Files/Search':
+            self.__reply(json.dumps(self.__search(params['Query'], params['Fields'])).encode('utf-8'),
+                         'application/json')
+        elif endpoint == 'File/SetInfo':
+            keys = params['File'].split(',')
+            for item in self.library:
+                if str(item['Key']) in (keys[:1] if self.first_key_only else keys):
+                    item[params['Field']] = params['Value']
+            self.__ok()
+        else:
+            self.send_error(404)
+
+
+class MediaServerTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StandInMCWS)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.address = f'127.0.0.1:{cls.server.server_address[1]}'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        StandInMCWS.library = [dict(i) for i in LIBRARY]
+        StandInMCWS.calls = []
+        StandInMCWS.first_key_only = False
+
+    def test_search_by_name_single_candidate(self):
+        match = MediaServer(self.address).search_by_name('Brazil')
+        self.assertEqual(match['Key'], 3)
+
+    def test_search_by_name_several_candidates_uses_exact_match(self):
+        match = MediaServer(self.address).search_by_name('Alien')
+        self.assertEqual(match['Key'], 1)
+
+    def test_search_by_name_no_candidates(self):
+        self.assertIsNone(MediaServer(self.address).search_by_name('Zardoz'))
+
+    def test_async_search_by_name(self):
+        async def find(names):
+            async with AsyncMediaServer(self.address, concurrency=4) as mc:
+                return await asyncio.gather(*[mc.search_by_name(n) for n in names])
+
+        matches = asyncio.run(find(['Alien', 'Brazil', 'Zardoz', 'The Third Man']))
+        self.assertEqual([m['Key'] if m else None for m in matches], [1, 3, None, 4])
+
+    def test_sync_and_async_search_by_name_agree(self):
+        names = [('Alien', False), ('Alien', True), ('Alie', False), ('Alie', True), ('Third Man', False),
+                 ('Zardoz', False), ('No Such Film', False)]
+
+        async def find():
+            async with AsyncMediaServer(self.address) as mc:
+                return [await mc.search_by_name(n, exact=e) for n, e in names]
+
+        mc = MediaServer(self.address)
+        self.assertEqual(asyncio.run(find()), [mc.search_by_name(n, exact=e) for n, e in names])
+
+    def __set_info_calls(self) -> List[str]:
+        return [c['File'] for c in StandInMCWS.calls if c['endpoint'] == 'File/SetInfo']
+
+    def test_set_values_groups_keys(self):
+        results = MediaServer(self.address).set_values([(k, 'Borrowed', '1') for k in (1, 2, 4)])
+        self.assertEqual(results, {('1', 'Borrowed'): True, ('2', 'Borrowed'): True, ('4', 'Borrowed'): True})
+        self.assertEqual(self.__set_info_calls(), ['1,2,4'])
+        self.assertTrue(all(str(i['Borrowed']) == '1' for i in StandInMCWS.library if i['Key'] in (1, 2, 4)))
+
+    def test_set_values_confirms_keys_which_are_not_movies(self):
+        results = MediaServer(self.address).set_values([(k, 'Borrowed', '1') for k in (1, 5)])
+        self.assertEqual(results, {('1', 'Borrowed'): True, ('5', 'Borrowed'): True})
+        self.assertEqual(self.__set_info_calls(), ['1,5'])
+
+    def test_set_values_confirms_each_key(self):
+        StandInMCWS.first_key_only = True
+        results = MediaServer(self.address).set_values([(k, 'Borrowed', '1') for k in (1, 2, 4)])
+        self.assertEqual(results, {('1', 'Borrowed'): True, ('2', 'Borrowed'): True, ('4', 'Borrowed'): True})
+        self.assertEqual(sorted(self.__set_info_calls()), ['1,2,4', '2', '4'])
+        self.assertTrue(all(str(i['Borrowed']) == '1' for i in StandInMCWS.library if i['Key'] in (1, 2, 4)))
+
+    def test_set_values_dry_run(self):
+        results = MediaServer(self.address).set_values([(1, 'Borrowed', '1')], dry_run=True)
+        self.assertEqual(results, {('1', 'Borrowed'): None})
+        self.assertEqual(self.__set_info_calls(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import json
+import socket
+import tempfile
+import threading
+import unittest
+from http.server import ThreadingHTTPServer
+from pathlib import Path
+
+import requests
+
+import test_mediaserver
+from mediaserver import MediaServer
+from snapshot import LibrarySnapshot
+
+QUERY = '[Name]=Alien'
+FIELDS = 'Name'
+
+
+def closed_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class LibrarySnapshotTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), test_mediaserver.StandInMCWS)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.address = f'127.0.0.1:{cls.server.server_address[1]}'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        test_mediaserver.StandInMCWS.library = [dict(i) for i in test_mediaserver.LIBRARY]
+        test_mediaserver.StandInMCWS.calls = []
+        self.__dir = tempfile.TemporaryDirectory()
+        self.cache_dir = Path(self.__dir.name)
+
+    def tearDown(self):
+        self.__dir.cleanup()
+
+    def __snapshot(self, address: str) -> LibrarySnapshot:
+        return LibrarySnapshot(MediaServer(address, retries=0), QUERY, FIELDS, self.cache_dir)
+
+    def __expire(self, snapshot: LibrarySnapshot):
+        with snapshot.file.open(mode='r', encoding='utf-8') as f:
+            cached = json.load(f)
+        cached['fetched_at'] = 0.0
+        with snapshot.file.open(mode='w', encoding='utf-8') as f:
+            json.dump(cached, f)
+
+    def test_load_fetches_then_reuses_cache(self):
+        items = self.__snapshot(self.address).load()
+        self.assertEqual([i['Key'] for i in items], [1, 2])
+        test_mediaserver.StandInMCWS.calls = []
+        self.assertEqual(self.__snapshot(self.address).load(), items)
+        self.assertEqual(test_mediaserver.StandInMCWS.calls, [])
+
+    def test_expired_snapshot_is_kept_when_server_is_unreachable(self):
+        snapshot = self.__snapshot(self.address)
+        items = snapshot.load()
+        self.__expire(snapshot)
+        unreachable = self.__snapshot(f'127.0.0.1:{closed_port()}')
+        self.assertEqual(unreachable.load(), items)
+        self.assertEqual(unreachable.by_key('1')['Name'], 'Alien')
+
+    def test_missing_snapshot_requires_server(self):
+        with self.assertRaises(requests.RequestException):
+            self.__snapshot(f'127.0.0.1:{closed_port()}').load()
+
+
+if __name__ == '__main__':
+    unittest.main()
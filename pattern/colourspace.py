@@ -0,0 +1,42 @@
+import hashlib
+import logging
+from pathlib import Path
+
+import colour
+import numpy as np
+
+logger = logging.getLogger()
+
+DISPLAY_P3 = colour.models.RGB_COLOURSPACE_DISPLAY_P3
+BT2020 = colour.models.RGB_COLOURSPACE_BT2020
+# linear light DisplayP3 to BT.2020, chromatically adapted with Bradford as per colour.RGB_to_RGB
+P3_TO_2020 = colour.matrix_RGB_to_RGB(DISPLAY_P3, BT2020, 'Bradford')
+
+
+def p3_to_2020(rgb: np.ndarray) -> np.ndarray:
+    """
+    Equivalent to colour.RGB_to_RGB from DisplayP3 to BT.2020 applying both cctfs but for any number of colours at
+    once, i.e. decode, one matrix multiply and encode over the whole array.
+    :param rgb: encoded DisplayP3 values in the range 0-1, shaped (..., 3).
+    :return: encoded BT.2020 values.
+    """
+    linear = DISPLAY_P3.cctf_decoding(np.asarray(rgb, dtype=np.float64))
+    return BT2020.cctf_encoding(linear @ P3_TO_2020.T)
+
+
+def cached_p3_to_2020(rgb: np.ndarray, cache_dir: Path) -> np.ndarray:
+    """
+    Converts a whole patch set, reusing the result from an earlier run if the patch set is unchanged.
+    :param rgb: the patch set, shaped (n, 3).
+    :param cache_dir: where to store the converted values.
+    :return: the converted values.
+    """
+    rgb = np.ascontiguousarray(rgb, dtype=np.float64)
+    cache_file = cache_dir / f'p3_2020_{hashlib.sha1(rgb.tobytes()).hexdigest()[:16]}.npy'
+    if cache_file.exists():
+        logger.info(f'Reusing converted patch set {cache_file}')
+        return np.load(cache_file)
+    converted = p3_to_2020(rgb)
+    np.save(cache_file, converted)
+    logger.info(f'Converted {len(rgb)} patches to BT.2020 in {cache_file}')
+    return converted
@@ -2,16 +2,19 @@ import argparse
 import csv
 import logging
 import math
+import os
 import shlex
 import subprocess
 import sys
 import time
+from concurrent.futures import Future, ProcessPoolExecutor
 from pathlib import Path
-from typing import Optional, List, Tuple
+from typing import Optional, List, Tuple, Dict
 
-import colour
 import numpy as np
 
+from colourspace import cached_p3_to_2020
+
 logger = logging.getLogger()
 
 FPS = 25
@@ -59,25 +62,25 @@ def chapter_duration(frame_count, fps) -> float:
     return round(frame_count * (1.0 / fps), 3)
 
 
-def process_patch(idx: int, r: float, g: float, b: float, cache_dir: Path, frame_count: int, force: bool, hdr: str) -> \
-        Tuple[str, Tuple[float, ...], str]:
-    gamma_percent = greyscale_percent(r, g, b)
+def cache_key(r: float, g: float, b: float) -> Tuple[int, int, int]:
+    return round(r * 1023), round(g * 1023), round(b * 1023)
+
+
+def process_patch(idx: int, r: float, g: float, b: float, cache_dir: Path, frame_count: int, force: bool, hdr: str,
+                  source: Optional[Tuple[float, float, float]] = None,
+                  x265_pools: Optional[int] = None) -> Tuple[str, Tuple[float, ...], str]:
+    """
+    :param source: the DisplayP3 colour if r, g, b have been converted from DisplayP3 to BT.2020.
+    :param x265_pools: the no of threads x265 may use, all cores if not set.
+    """
+    gamma_percent = greyscale_percent(*(source or (r, g, b)))
     r_in_10 = round(r * 1023)
     g_in_10 = round(g * 1023)
     b_in_10 = round(b * 1023)
 
-    if hdr and hdr == 'p3':
-        cs = colour.models.RGB_COLOURSPACE_DISPLAY_P3
-        os = colour.models.RGB_COLOURSPACE_BT2020
-
-        rgb_in = np.array([r, g, b])
-        displayp3_in_2020 = colour.RGB_to_RGB(rgb_in,
-                                              cs,
-                                              os,
-                                              'Bradford',
-                                              apply_cctf_decoding=True,
-                                              apply_cctf_encoding=True)
-        r, g, b = displayp3_in_2020
+    if source is not None:
+        rgb_in = np.array(source)
+        displayp3_in_2020 = np.array([r, g, b])
         r_in_10, g_in_10, b_in_10 = np.round(displayp3_in_2020 * 1023)
         logger.info(
             f'Generating patch {idx} using p3 in 2020 {np.round(rgb_in * 1023)} -> {np.round(displayp3_in_2020 * 1023)} ({rgb_in} -> {displayp3_in_2020})')
@@ -127,15 +130,17 @@ def process_patch(idx: int, r: float, g: float, b: float, cache_dir: Path, frame
 
     duration = chapter_duration(frame_count, FPS)
 
+    pools = f':pools={x265_pools}' if x265_pools else ''
+
     def do_it(f):
         if hdr:
-            x265_params = "crf=12:colorprim=bt2020:transfer=smpte2084:colormatrix=bt2020nc:master-display=\"G(13250,34500)B(7500,3000)R(34000,16000)WP(15635,16450)L(10000000,1)\":max-cll=\"1000,400\""
+            x265_params = f"crf=12:colorprim=bt2020:transfer=smpte2084:colormatrix=bt2020nc:master-display=\"G(13250,34500)B(7500,3000)R(34000,16000)WP(15635,16450)L(10000000,1)\":max-cll=\"1000,400\"{pools}"
             vf_params = f"scale=out_color_matrix=bt2020:out_h_chr_pos=0:out_v_chr_pos=0,format=yuv420p10,loop=-1:1"
             text_params = f",drawtext=text='{text_overlay}':fontcolor={text_colour}:x=40:y=h-th-40:expansion=none:fontsize=36"
             text_params = ''
             cmd = f"ffmpeg -y -framerate {FPS} -i {patch_file_abs} -c:v libx265 -x265-params \"{x265_params}\" -t {duration} -vf \"{vf_params}{text_params}\" {f}"
         else:
-            cmd = f"ffmpeg -y -framerate {FPS} -i {patch_file_abs} -c:v libx265 -x265-params \"lossless=1\" -t {duration} -vf \"colorspace=all=bt709:iall=bt601-6-625:fast=1:format=yuv420p10,drawtext=text='{text_overlay}':fontcolor={text_colour}:x=40:y=h-th-40:expansion=none:fontsize=36,loop=-1:1\" -colorspace 1 -color_primaries 1 -color_trc 1 -sws_flags accurate_rnd+full_chroma_int {f}"
+            cmd = f"ffmpeg -y -framerate {FPS} -i {patch_file_abs} -c:v libx265 -x265-params \"lossless=1{pools}\" -t {duration} -vf \"colorspace=all=bt709:iall=bt601-6-625:fast=1:format=yuv420p10,drawtext=text='{text_overlay}':fontcolor={text_colour}:x=40:y=h-th-40:expansion=none:fontsize=36,loop=-1:1\" -colorspace 1 -color_primaries 1 -color_trc 1 -sws_flags accurate_rnd+full_chroma_int {f}"
         before = time.time()
         run_it('MP4 generation', cmd)
         after = time.time()
@@ -214,26 +219,24 @@ def generate_pattern(patchset: str, path: Path, vids: List[str], chapters: List[
            f'ffmpeg -y -f concat -safe 0 -i {ffmpeg_concat.absolute()} -i {ffmpeg_meta.absolute()} -map_chapters 1 -c copy {patchset_vid}')
 
 
-def do_patch(idx: int, r: float, g: float, b: float, cache_dir: Path, frame_count: int, force: bool, vids: List[str],
-             chapters: List[str], rgbs: List[Tuple[float, ...]], success: int, hdr: str) -> bool:
-    try:
-        vid, rgb, txt_overlay = process_patch(idx, r, g, b, cache_dir, frame_count, force, hdr)
-        vids.append(vid)
-        rgbs.append(rgb)
-        chapters.append('[CHAPTER]')
-        chapters.append('TIMEBASE=1/1000')
-        chapters.append(f'START={success * (chapter_duration(frame_count, FPS) * 1000):.0f}')
-        success = success + 1
-        chapters.append(f'END={(success * (chapter_duration(frame_count, FPS) * 1000)) - 1:.0f}')
-        chapters.append(f'title={success} - {txt_overlay}')
-        chapters.append('')
-        return True
-    except:
-        failed.append(idx)
-        return False
-
-
-def process_patchset(patchset_path: str, cachedir: str, frame_count: int, force: bool, hdr: str):
+def chapter(success: int, frame_count: int, txt_overlay: str) -> List[str]:
+    """
+    :param success: the no of patches already in the pattern.
+    :return: the metadata for the chapter holding the next patch.
+    """
+    length = chapter_duration(frame_count, FPS) * 1000
+    return [
+        '[CHAPTER]',
+        'TIMEBASE=1/1000',
+        f'START={success * length:.0f}',
+        f'END={((success + 1) * length) - 1:.0f}',
+        f'title={success + 1} - {txt_overlay}',
+        ''
+    ]
+
+
+def process_patchset(patchset_path: str, cachedir: str, frame_count: int, force: bool, hdr: str, workers: int = 1,
+                     x265_pools: Optional[int] = None):
     logger.info(f'Processing patchset: {patchset_path}')
     path = Path(patchset_path)
     cache_dir = Path(cachedir)
@@ -250,6 +253,7 @@ def process_patchset(patchset_path: str, cachedir: str, frame_count: int, force:
     rgbs: List[Tuple[float, ...]] = []
     chapters: List[str] = []
     is_verify = path.parent.name == 'verify'
+    patches: List[Tuple[int, float, float, float]] = []
     with patch_def_file.open() as f:
         patch_reader = csv.reader(f)
         extra_patches = 0
@@ -262,11 +266,38 @@ def process_patchset(patchset_path: str, cachedir: str, frame_count: int, force:
             if idx == 0 and is_verify:
                 extra_patches = 3 if is_white else 4
                 for i in range(extra_patches):
-                    if do_patch(i, 1.0, 1.0, 1.0, cache_dir, frame_count, force, vids, chapters, rgbs, success, hdr):
-                        success = success + 1
-            if do_patch(idx + extra_patches, r, g, b, cache_dir, frame_count, force, vids, chapters, rgbs, success,
-                        hdr):
-                success = success + 1
+                    patches.append((i, 1.0, 1.0, 1.0))
+            patches.append((idx + extra_patches, r, g, b))
+
+    # convert the whole patch set in one go rather than patch by patch
+    source_rgb = np.array([p[1:] for p in patches]).reshape(-1, 3)
+    converted = cached_p3_to_2020(source_rgb, cache_dir) if hdr == 'p3' else None
+    # patches are generated concurrently, each distinct colour once as duplicates share the same cache files
+    futures: Dict[Tuple[int, int, int], Future] = {}
+    keys = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for i, (idx, r, g, b) in enumerate(patches):
+            source = None
+            if converted is not None:
+                source = (r, g, b)
+                r, g, b = converted[i]
+            key = cache_key(r, g, b)
+            keys.append(key)
+            if key not in futures:
+                futures[key] = executor.submit(process_patch, idx, r, g, b, cache_dir, frame_count, force, hdr, source,
+                                               x265_pools)
+        # assemble in patch set order
+        for (idx, _, _, _), key in zip(patches, keys):
+            try:
+                vid, rgb, txt_overlay = futures[key].result()
+            except:
+                logger.exception(f'Patch {idx} failed')
+                failed.append(idx)
+                continue
+            vids.append(vid)
+            rgbs.append(rgb)
+            chapters.extend(chapter(success, frame_count, txt_overlay))
+            success = success + 1
 
     if failed:
         raise ValueError(f'Failed to generate {len(failed)} mp4, {success} completed ok [{failed}]')
@@ -304,13 +335,17 @@ if __name__ == '__main__':
                         help='Generates patterns with HDR metadata in a HDR colourspace (DisplayP3 or Rec2020)',
                         nargs='?',
                         choices=['p3', '2020'])
+    parser.add_argument('-w', '--workers', help='No of patches to generate concurrently', default=4, type=int)
+    parser.add_argument('--x265-pools', help='No of threads each x265 encode may use, defaults to cores / workers',
+                        type=int)
 
     args = parser.parse_args()
+    x265_pools = args.x265_pools or max(1, os.cpu_count() // args.workers)
 
     failed = []
     for ps in args.patchsets:
         try:
-            process_patchset(ps, args.cache_dir, args.fps, args.force, args.hdr)
+            process_patchset(ps, args.cache_dir, args.fps, args.force, args.hdr, args.workers, x265_pools)
         except:
             logger.exception(f'Patchset failed: {ps}')
             failed.append(ps)
@@ -0,0 +1,89 @@
+import argparse
+import time
+from functools import lru_cache
+from typing import Callable, Dict
+
+import numpy as np
+from colour import gamma_function
+from colour.models import eotf_BT1886, eotf_ST2084
+
+# transfer functions from a normalised signal to luminance, pq is absolute (nits), the others are relative to peak
+EOTFS: Dict[str, Callable[[np.ndarray], np.ndarray]] = {
+    'pq': eotf_ST2084,
+    'bt1886': eotf_BT1886,
+    'gamma2.2': lambda v: gamma_function(v, 2.2),
+    'gamma2.4': lambda v: gamma_function(v, 2.4),
+}
+BIT_DEPTHS = [8, 10, 12, 16]
+
+
+def signal(bits: int) -> np.ndarray:
+    """
+    :param bits: the bit depth.
+    :return: every full range code value normalised to 0-1.
+    """
+    return np.arange(2 ** bits) / (2 ** bits - 1)
+
+
+@lru_cache(maxsize=None)
+def eotf_lut(transfer: str, bits: int) -> np.ndarray:
+    """
+    :param transfer: one of EOTFS.
+    :param bits: the bit depth of the code values.
+    :return: the eotf evaluated at every code value, to be indexed by an integer array of codes.
+    """
+    if transfer not in EOTFS:
+        raise ValueError(f'Unknown transfer {transfer}, expected one of {list(EOTFS.keys())}')
+    lut = np.asarray(EOTFS[transfer](signal(bits)), dtype=np.float64)
+    # shared by every caller so must not be modified
+    lut.flags.writeable = False
+    return lut
+
+
+@lru_cache(maxsize=None)
+def gamma_lut(gamma: float, bits: int) -> np.ndarray:
+    """
+    :param gamma: any power law exponent, not just those in EOTFS.
+    :param bits: the bit depth of the code values.
+    :return: the power law evaluated at every code value, to be indexed by an integer array of codes.
+    """
+    lut = np.asarray(gamma_function(signal(bits), gamma), dtype=np.float64)
+    # shared by every caller so must not be modified
+    lut.flags.writeable = False
+    return lut
+
+
+def to_linear(codes: np.ndarray, transfer: str = 'pq', bits: int = 10) -> np.ndarray:
+    """
+    :param codes: unsigned integer code values.
+    :param transfer: one of EOTFS.
+    :param bits: the bit depth of the codes.
+    :return: the luminance of each code.
+    """
+    return eotf_lut(transfer, bits)[codes]
+
+
+def verify(samples: int = 8_000_000):
+    """
+    Reports the time taken to convert a frame's worth of random codes via colour and via the table, test_luts checks
+    the tables themselves.
+    """
+    rng = np.random.default_rng()
+    for transfer, eotf in EOTFS.items():
+        for bits in BIT_DEPTHS:
+            eotf_lut(transfer, bits)
+            codes = rng.integers(0, 2 ** bits, samples, dtype=np.uint16)
+            before = time.perf_counter()
+            eotf(codes / (2 ** bits - 1))
+            mid = time.perf_counter()
+            to_linear(codes, transfer, bits)
+            after = time.perf_counter()
+            print(f'{transfer:>8} {bits:>2} bit colour {(mid - before) * 1000:.1f}ms lut {(after - mid) * 1000:.1f}ms')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='luts', description='Times the EOTF lookup tables against colour-science')
+    parser.add_argument('-n', '--samples', help='No of code values to convert when timing', default=8_000_000,
+                        type=int)
+    args = parser.parse_args()
+    verify(args.samples)
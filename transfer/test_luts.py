@@ -0,0 +1,43 @@
+import unittest
+
+import numpy as np
+from colour import gamma_function
+
+from luts import BIT_DEPTHS, EOTFS, eotf_lut, gamma_lut, signal, to_linear
+
+
+class EOTFLutTest(unittest.TestCase):
+
+    def test_tables_match_colour_at_every_code(self):
+        for transfer, eotf in EOTFS.items():
+            for bits in BIT_DEPTHS:
+                with self.subTest(transfer=transfer, bits=bits):
+                    np.testing.assert_array_equal(eotf_lut(transfer, bits), np.asarray(eotf(signal(bits))))
+
+    def test_to_linear_matches_colour(self):
+        rng = np.random.default_rng(0)
+        for transfer, eotf in EOTFS.items():
+            for bits in BIT_DEPTHS:
+                with self.subTest(transfer=transfer, bits=bits):
+                    codes = rng.integers(0, 2 ** bits, 100_000, dtype=np.uint16)
+                    np.testing.assert_array_equal(to_linear(codes, transfer, bits), eotf(codes / (2 ** bits - 1)))
+
+    def test_gamma_lut_accepts_any_exponent(self):
+        for gamma in (2.0, 2.2, 2.4, 2.6):
+            with self.subTest(gamma=gamma):
+                np.testing.assert_array_equal(gamma_lut(gamma, 8), gamma_function(np.arange(256) / 255, gamma))
+        np.testing.assert_array_equal(gamma_lut(2.2, 8), eotf_lut('gamma2.2', 8))
+
+    def test_tables_are_read_only(self):
+        with self.assertRaises(ValueError):
+            eotf_lut('pq', 10)[0] = 1.0
+        with self.assertRaises(ValueError):
+            gamma_lut(2.6, 8)[0] = 1.0
+
+    def test_unknown_transfer(self):
+        with self.assertRaises(ValueError):
+            eotf_lut('gamma2.6', 8)
+
+
+if __name__ == '__main__':
+    unittest.main()